@@ -1,13 +1,16 @@
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import models
 from .db import get_db
+from .utils.workers import PoolBusy, password_hashing
 import os
 from dotenv import load_dotenv
 
@@ -18,27 +21,59 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
+# Seconds an authenticated user stays cached per worker process, so most
+# requests identify the user without a database query. The cache is per
+# process: a deactivation or role change is applied at once in the worker
+# that made it and within this many seconds in the others, hence the cap.
+PRINCIPAL_CACHE_MAX_TTL = 60
+PRINCIPAL_CACHE_TTL = min(float(os.getenv("PRINCIPAL_CACHE_TTL", "60")), PRINCIPAL_CACHE_MAX_TTL)
+PRINCIPAL_CACHE_MAX = int(os.getenv("PRINCIPAL_CACHE_MAX", "10000"))
+
+# Accept the user id / active claims signed into the token without looking the
+# user up at all. A deactivation then only takes effect in other worker
+# processes when the token expires, so this is off by default.
+AUTH_TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "false").lower() in ("1", "true", "yes")
+
+# bcrypt cost factor for new hashes; existing hashes are upgraded on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# bcrypt runs in its own bounded thread pool so it never blocks the event loop
+async def _run_hashing(func, *args):
+    try:
+        return await password_hashing.run(func, *args)
+    except PoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-in requests, please try again shortly",
+            headers={"Retry-After": "1"}
+        )
+
 # Verify password
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    return await _run_hashing(pwd_context.verify, plain_password, hashed_password)
 
 # Hash password
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await _run_hashing(pwd_context.hash, password)
 
 # Authenticate user
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(models.User).filter(models.User.username == username).first()
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await db.scalar(select(models.User).where(models.User.username == username))
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await _run_hashing(pwd_context.verify_and_update, password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        # Stored with an older cost factor; re-hash with BCRYPT_ROUNDS
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
 # Create access token
@@ -52,8 +87,99 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+class Principal:
+    """
+    The authenticated user as seen by route handlers
+
+    A detached snapshot of the User columns the routes read, safe to share
+    between requests through the principal cache.
+    """
+
+    __slots__ = ("id", "username", "email", "is_active", "is_admin")
+
+    def __init__(self, id, username, email, is_active, is_admin=False):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.is_active = is_active
+        self.is_admin = is_admin
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.email, bool(user.is_active), bool(user.is_admin))
+
+class PrincipalCache:
+    """Process-local username -> Principal cache with a short TTL"""
+
+    def __init__(self, ttl=PRINCIPAL_CACHE_TTL, max_entries=PRINCIPAL_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        # Users invalidated here; signed claims are not trusted for them
+        self._revoked = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username):
+        entry = self._entries.get(username)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def put(self, principal):
+        if self.ttl <= 0:
+            return
+        if len(self._entries) >= self.max_entries:
+            # Evict the oldest insertion
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[principal.username] = (time.monotonic() + self.ttl, principal)
+
+    def invalidate(self, username):
+        self._entries.pop(username, None)
+        self._revoked[username] = time.monotonic() + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+    def is_revoked(self, username):
+        until = self._revoked.get(username)
+        if until is None:
+            return False
+        if until < time.monotonic():
+            del self._revoked[username]
+            return False
+        return True
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+principal_cache = PrincipalCache()
+
+def invalidate_principal(username):
+    """
+    Drop a user's cached principal after deactivation or another change
+
+    Args:
+        username: The token subject
+    """
+    principal_cache.invalidate(username)
+
+def principal_claims(user):
+    """
+    Claims signed into an access token for a user
+
+    Returns:
+        dict: sub plus the id, email, active and admin flags used to build a Principal
+    """
+    return {
+        "sub": user.username,
+        "uid": user.id,
+        "email": user.email,
+        "act": bool(user.is_active),
+        "adm": bool(user.is_admin)
+    }
+
 # Get current user
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid authentication credentials",
@@ -66,13 +192,32 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if user is None:
-        raise credentials_exception
-    return user
+
+    principal = principal_cache.get(username)
+    if principal is not None:
+        return principal
+
+    if AUTH_TRUST_TOKEN_CLAIMS and "uid" in payload and "act" in payload and not principal_cache.is_revoked(username):
+        principal = Principal(
+            payload["uid"], username, payload.get("email"), bool(payload["act"]), bool(payload.get("adm"))
+        )
+    else:
+        user = await db.scalar(select(models.User).where(models.User.username == username))
+        if user is None:
+            raise credentials_exception
+        principal = Principal.from_user(user)
+
+    principal_cache.put(principal)
+    return principal
 
 # Get current active user
 async def get_current_active_user(current_user: models.User = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user
\ No newline at end of file
+    return current_user
+
+# Get current admin user
+async def get_current_admin_user(current_user: models.User = Depends(get_current_active_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
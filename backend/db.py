@@ -1,35 +1,182 @@
-from sqlalchemy import create_engine
+import time
+import threading
+from sqlalchemy import event, exc, inspect
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 import os
 from dotenv import load_dotenv
 
+from .utils.metrics import Histogram
+
 load_dotenv()
 
 # Get database URL from environment variable or use SQLite as fallback
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sriox.db")
 
+# Connection pool settings (ignored for SQLite, which does not pool connections)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+def get_async_url(url):
+    """
+    Map a plain database URL onto its asyncio driver
+
+    Args:
+        url: Database URL as configured, e.g. postgresql://... or sqlite:///...
+
+    Returns:
+        str: URL using asyncpg or aiosqlite
+    """
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:"):
+        return url.replace("postgresql:", "postgresql+asyncpg:", 1)
+    if url.startswith("postgres:"):
+        return url.replace("postgres:", "postgresql+asyncpg:", 1)
+    return url
+
+ASYNC_DATABASE_URL = get_async_url(DATABASE_URL)
+
+class PoolStats:
+    """Counters and checkout wait times for the engine's connection pool"""
+
+    def __init__(self):
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait = Histogram()
+        self._lock = threading.Lock()
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+pool_stats = PoolStats()
+
+class _InstrumentedPoolMixin:
+    """Times how long callers wait to get a connection out of the pool"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.incr("timeouts")
+            raise
+        finally:
+            pool_stats.wait.observe(time.perf_counter() - start)
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+class InstrumentedNullPool(_InstrumentedPoolMixin, NullPool):
+    pass
+
 # Configure SQLAlchemy engine based on database type
 if DATABASE_URL.startswith("sqlite"):
     # SQLite specific configuration
-    engine = create_engine(
-        DATABASE_URL, 
+    engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=InstrumentedNullPool,
         connect_args={"check_same_thread": False}  # SQLite specific, allows multiple threads to access db
     )
 else:
     # PostgreSQL or other database configuration
-    engine = create_engine(DATABASE_URL)
+    engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING
+    )
+
+@event.listens_for(engine.sync_engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    pool_stats.incr("connects")
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_stats.incr("checkouts")
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    pool_stats.incr("checkins")
+
+@event.listens_for(engine.sync_engine, "invalidate")
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    pool_stats.incr("invalidations")
+
+def get_pool_status():
+    """
+    Describe the current state of the connection pool
+
+    Returns:
+        dict: Pool configuration, live gauges and lifetime counters
+    """
+    pool = engine.pool
+    status = {
+        "pool_class": type(pool).__name__,
+        "pid": os.getpid(),
+        "connects": pool_stats.connects,
+        "checkouts": pool_stats.checkouts,
+        "checkins": pool_stats.checkins,
+        "invalidations": pool_stats.invalidations,
+        "timeouts": pool_stats.timeouts,
+        "checkout_wait": pool_stats.wait.snapshot()
+    }
+
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        status.update({
+            "size": pool.size(),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "timeout": DB_POOL_TIMEOUT,
+            "recycle": DB_POOL_RECYCLE,
+            "pre_ping": DB_POOL_PRE_PING,
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow()
+        })
+
+    return status
 
 # Create SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay usable after commit; lazy loads are not possible on an AsyncSession
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 # Create Base class
 Base = declarative_base()
 
 # Database dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
+
+def add_missing_columns(connection):
+    """
+    Add nullable columns that the models define but existing tables lack
+
+    create_all() only creates missing tables, so this covers new optional
+    columns on databases created by an earlier version.
+
+    Args:
+        connection: Synchronous connection (use with AsyncConnection.run_sync)
+    """
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
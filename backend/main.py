@@ -1,18 +1,17 @@
 import os
 from fastapi import FastAPI, Request, Depends, HTTPException
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
 
-from .db import engine, get_db, Base
-from .routes import upload, redirect, github, user
+from .routes import upload, upload_sessions, redirect, github, user, jobs as jobs_routes, stats, admin
 from . import models
 from .auth import get_current_active_user
-
-# Create tables in the database
-Base.metadata.create_all(bind=engine)
+from .utils import cloudflare, jobs, routing, serving
+from .utils import provisioning  # noqa: F401 - registers the job handlers
+from .utils.body_limit import BodySizeLimitMiddleware
+from .utils.site_host import SiteHostMiddleware
 
 app = FastAPI(
     title="Sriox Platform",
@@ -32,6 +31,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Refuse oversized request bodies while they stream in (upload limit plus
+# room for the multipart envelope and form fields)
+app.add_middleware(BodySizeLimitMiddleware, max_body_size=upload.MAX_UPLOAD_SIZE + 1000000)
+
+# Requests for <subdomain>.DOMAIN_NAME are answered with the hosted site's
+# files straight away, without going through the router
+if os.environ.get("SITE_HOST_ROUTING", "true").lower() in ("1", "true", "yes"):
+    app.add_middleware(SiteHostMiddleware, domain_name=os.environ.get("DOMAIN_NAME", "sriox.com"))
+
 # Security headers middleware
 @app.middleware("http")
 async def add_security_headers(request: Request, call_next):
@@ -52,11 +60,34 @@ app.mount("/static", StaticFiles(directory=os.path.join(current_dir, "static")),
 # Templates
 templates = Jinja2Templates(directory=os.path.join(current_dir, "templates"))
 
+# Tables are created by "python -m backend.migrate", run once before the
+# server starts (see run.py and gunicorn.conf.py)
+
+# Warm the in-memory routing tables before serving traffic
+@app.on_event("startup")
+async def load_routing_tables():
+    await routing.sites.reload()
+    await routing.redirects.reload()
+
+# Background workers for DNS, extraction and cleanup jobs
+@app.on_event("startup")
+async def start_job_workers():
+    jobs.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await jobs.stop()
+    await cloudflare.close()
+
 # Include routers
 app.include_router(user.router)
 app.include_router(upload.router)
+app.include_router(upload_sessions.router)
 app.include_router(redirect.router)
 app.include_router(github.router)
+app.include_router(jobs_routes.router)
+app.include_router(stats.router)
+app.include_router(admin.router)
 
 # Root endpoint
 @app.get("/", response_class=HTMLResponse)
@@ -136,42 +167,16 @@ async def root():
 
 # Serve hosted websites at subdomains
 @app.get("/subdomain/{subdomain}", include_in_schema=False)
-async def get_subdomain_website(subdomain: str, path: str = "", db: Session = Depends(get_db)):
-    # Find the website in the database
-    website = db.query(models.Website).filter(models.Website.subdomain == subdomain).first()
+@app.get("/subdomain/{subdomain}/{file_path:path}", include_in_schema=False)
+async def get_subdomain_website(request: Request, subdomain: str, file_path: str = "", path: str = ""):
+    # Resolve the website folder from the in-memory routing table
+    site_folder = await routing.sites.get(subdomain)
     
-    if not website:
+    if not site_folder:
         raise HTTPException(status_code=404, detail="Subdomain not found")
     
-    # Build the path to the requested file
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    file_path = os.path.join(base_dir, website.folder_path)
-    
-    # If path is empty, try to serve index.html
-    if not path:
-        file_path = os.path.join(file_path, "index.html")
-    else:
-        file_path = os.path.join(file_path, path)
-    
-    # Check if the file exists
-    if not os.path.exists(file_path) or not os.path.isfile(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    # Serve the file
-    return FileResponse(file_path)
-
-# Serve redirect pages
-@app.get("/{redirect_name}", include_in_schema=False)
-async def get_redirect(redirect_name: str, request: Request, db: Session = Depends(get_db)):
-    # Check if this is a redirect
-    redirect = db.query(models.Redirect).filter(models.Redirect.name == redirect_name).first()
-    
-    if not redirect:
-        # Not a redirect, return 404
-        raise HTTPException(status_code=404, detail="Redirect not found")
-    
-    # Serve the redirect template
-    return templates.TemplateResponse(f"redirects/{redirect_name}.html", {"request": request})
+    # The ?path= query parameter is still accepted from older links
+    return await serving.serve_site_file(request, site_folder, file_path or path)
 
 # Dashboard page template
 @app.get("/dashboard", response_class=HTMLResponse)
@@ -191,4 +196,16 @@ async def signup_page(request: Request):
 # Health check endpoint for container orchestration
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "sriox-platform"}
\ No newline at end of file
+    return {"status": "healthy", "service": "sriox-platform"}
+
+# Serve redirects; registered last so the named pages above take precedence
+@app.get("/{redirect_name}", include_in_schema=False)
+async def get_redirect(redirect_name: str):
+    # Resolve the redirect from the in-memory table
+    compiled = await routing.redirects.get(redirect_name)
+    
+    if not compiled:
+        # Not a redirect, return 404
+        raise HTTPException(status_code=404, detail="Redirect not found")
+    
+    return compiled.response()
\ No newline at end of file
@@ -0,0 +1,34 @@
+import asyncio
+import logging
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from .db import ASYNC_DATABASE_URL, Base, add_missing_columns
+from . import models  # noqa: F401 - registers the tables on Base.metadata
+
+async def migrate():
+    """
+    Create missing tables and columns
+
+    Runs once per deploy, before any server process starts, instead of in
+    every worker on startup. Uses its own unpooled engine, so no connection
+    outlives the migration (the gunicorn master forks workers afterwards).
+    """
+    engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=NullPool)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(add_missing_columns)
+    finally:
+        await engine.dispose()
+
+    logging.info("Database schema is up to date")
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(migrate())
+
+if __name__ == "__main__":
+    # python -m backend.migrate
+    main()
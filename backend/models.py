@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -12,11 +12,13 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     is_active = Column(Boolean, default=True)
+    is_admin = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     websites = relationship("Website", back_populates="owner", cascade="all, delete-orphan")
     redirects = relationship("Redirect", back_populates="owner", cascade="all, delete-orphan")
     github_mappings = relationship("GitHubMapping", back_populates="owner", cascade="all, delete-orphan")
+    quotas = relationship("Quota", cascade="all, delete-orphan")
 
 class Website(Base):
     __tablename__ = "websites"
@@ -24,11 +26,29 @@ class Website(Base):
     id = Column(Integer, primary_key=True, index=True)
     subdomain = Column(String, unique=True, index=True)
     folder_path = Column(String)
+    dns_record_id = Column(String, nullable=True)  # Cloudflare record id, set once DNS is created
+    deployment_id = Column(Integer, nullable=True)  # Live deployment; folder_path points at its folder
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     user_id = Column(Integer, ForeignKey("users.id"))
 
     owner = relationship("User", back_populates="websites")
+    deployments = relationship("Deployment", back_populates="website", cascade="all, delete-orphan")
+
+class Deployment(Base):
+    __tablename__ = "deployments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    website_id = Column(Integer, ForeignKey("websites.id"), index=True)
+    folder_path = Column(String)
+    status = Column(String, default="building")  # building, ready, failed
+    file_count = Column(Integer, nullable=True)
+    total_size = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    activated_at = Column(DateTime(timezone=True), nullable=True)
+
+    website = relationship("Website", back_populates="deployments")
 
 class Redirect(Base):
     __tablename__ = "redirects"
@@ -49,8 +69,61 @@ class GitHubMapping(Base):
     subdomain = Column(String, unique=True, index=True)
     github_username = Column(String)
     repository_name = Column(String)
+    dns_record_id = Column(String, nullable=True)  # Cloudflare record id, set once DNS is created
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     user_id = Column(Integer, ForeignKey("users.id"))
 
-    owner = relationship("User", back_populates="github_mappings")
\ No newline at end of file
+    owner = relationship("User", back_populates="github_mappings")
+
+class Quota(Base):
+    __tablename__ = "quotas"
+    __table_args__ = (UniqueConstraint("user_id", "resource"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    resource = Column(String)  # websites, redirects or github_mappings
+    max_allowed = Column(Integer)
+    used = Column(Integer, default=0)  # kept in step with inserts and deletes
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    subdomain = Column(String, nullable=True)  # Set for a new website
+    website_id = Column(Integer, nullable=True)  # Set for a new deployment of an existing website
+    size = Column(Integer)  # Declared size of the whole archive
+    sha256 = Column(String)  # Declared hash of the whole archive, checked when finalizing
+    received = Column(Integer, default=0)  # Bytes stored so far; the next chunk's offset
+    file_path = Column(String)
+    expires_at = Column(DateTime, index=True)  # naive UTC; extended by every chunk
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class PendingBlob(Base):
+    __tablename__ = "pending_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    sha256 = Column(String)  # Stored through the delta deploy API, not yet committed
+    size = Column(Integer)
+    expires_at = Column(DateTime, index=True)  # naive UTC; the blob may be collected from then on
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, index=True)
+    payload = Column(Text)  # JSON; handlers record completed steps here
+    status = Column(String, default="pending", index=True)  # pending, running, succeeded, failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    last_error = Column(Text, nullable=True)
+    run_after = Column(DateTime, index=True)  # naive UTC
+    locked_at = Column(DateTime, nullable=True)  # naive UTC
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
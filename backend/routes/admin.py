@@ -0,0 +1,96 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, Field
+
+from .. import models
+from ..db import get_db
+from ..auth import get_current_admin_user, invalidate_principal
+from ..utils import quotas
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+class QuotaUpdate(BaseModel):
+    max_allowed: int = Field(..., ge=0)
+
+class UserUpdate(BaseModel):
+    is_active: Optional[bool] = None
+    is_admin: Optional[bool] = None
+
+async def get_user_or_404(db, user_id):
+    user = await db.scalar(select(models.User).where(models.User.id == user_id))
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return user
+
+@router.get("/users/{user_id}/quotas")
+async def get_user_quotas(
+    user_id: int,
+    db: AsyncSession = Depends(get_db),
+    admin: models.User = Depends(get_current_admin_user)
+):
+    """Get a user's limit and usage for each resource"""
+    await get_user_or_404(db, user_id)
+
+    user_quotas = await quotas.get_quotas(db, user_id)
+    await db.commit()
+
+    return user_quotas
+
+@router.put("/users/{user_id}/quotas/{resource}")
+async def update_user_quota(
+    user_id: int,
+    resource: str,
+    quota_update: QuotaUpdate,
+    db: AsyncSession = Depends(get_db),
+    admin: models.User = Depends(get_current_admin_user)
+):
+    """Change a user's limit for websites, redirects or github_mappings"""
+    if resource not in quotas.RESOURCES:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown resource; use one of: {', '.join(quotas.RESOURCES)}"
+        )
+
+    await get_user_or_404(db, user_id)
+
+    await quotas.set_limit(db, user_id, resource, quota_update.max_allowed)
+    user_quotas = await quotas.get_quotas(db, user_id)
+    await db.commit()
+
+    return user_quotas
+
+@router.patch("/users/{user_id}")
+async def update_user(
+    user_id: int,
+    user_update: UserUpdate,
+    db: AsyncSession = Depends(get_db),
+    admin: models.User = Depends(get_current_admin_user)
+):
+    """Activate or deactivate a user, or grant or revoke admin rights"""
+    if user_id == admin.id and (user_update.is_active is False or user_update.is_admin is False):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="You cannot deactivate yourself or revoke your own admin rights"
+        )
+
+    user = await get_user_or_404(db, user_id)
+
+    if user_update.is_active is not None:
+        user.is_active = user_update.is_active
+    if user_update.is_admin is not None:
+        user.is_admin = user_update.is_admin
+    await db.commit()
+
+    # Applies at once in this worker; other workers pick it up when their
+    # cached copy expires (PRINCIPAL_CACHE_TTL)
+    invalidate_principal(user.username)
+
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "is_active": bool(user.is_active),
+        "is_admin": bool(user.is_admin)
+    }
@@ -1,14 +1,15 @@
 import os
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
 from pydantic import BaseModel
 
 from .. import models
 from ..db import get_db
 from ..auth import get_current_active_user
-from ..utils import cloudflare, validators
+from ..utils import jobs, listing, quotas, validators
 
 router = APIRouter(tags=["github-pages"])
 
@@ -22,46 +23,70 @@ class GitHubMappingUpdate(BaseModel):
     github_username: str
     repository_name: str
 
-@router.get("/github-mappings", response_model=List)
+class GitHubMappingItem(BaseModel):
+    id: Optional[int] = None
+    subdomain: Optional[str] = None
+    github_username: Optional[str] = None
+    repository_name: Optional[str] = None
+    url: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class GitHubMappingList(BaseModel):
+    items: List[GitHubMappingItem]
+    next_cursor: Optional[str] = None
+
+@router.get("/github-mappings", response_model=GitHubMappingList, response_model_exclude_unset=True)
 async def get_user_github_mappings(
-    db: Session = Depends(get_db),
+    params: listing.ListQuery = Depends(),
+    github_username: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Get all GitHub mappings created by the current user"""
-    mappings = db.query(models.GitHubMapping).filter(models.GitHubMapping.user_id == current_user.id).all()
-    return mappings
+    """List the current user's GitHub mappings, one page at a time"""
+    filters = [models.GitHubMapping.user_id == current_user.id]
+    if github_username:
+        filters.append(models.GitHubMapping.github_username == github_username)
+    
+    domain_name = os.getenv("DOMAIN_NAME", "sriox.com")
+    
+    items, next_cursor = await listing.list_page(
+        db, models.GitHubMapping, params,
+        columns={
+            "id": models.GitHubMapping.id,
+            "subdomain": models.GitHubMapping.subdomain,
+            "github_username": models.GitHubMapping.github_username,
+            "repository_name": models.GitHubMapping.repository_name,
+            "created_at": models.GitHubMapping.created_at,
+            "updated_at": models.GitHubMapping.updated_at
+        },
+        sortable=["id", "subdomain", "created_at"],
+        name_column=models.GitHubMapping.subdomain,
+        filters=filters,
+        computed={"url": (["subdomain"], lambda row: f"https://{row['subdomain']}.{domain_name}")}
+    )
+    return GitHubMappingList(items=[GitHubMappingItem(**item) for item in items], next_cursor=next_cursor)
 
 @router.get("/github-mapping/count")
 async def get_github_mapping_count(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Get the count of GitHub mappings created by the current user"""
-    count = db.query(func.count(models.GitHubMapping.id)).filter(
+    count = await db.scalar(select(func.count(models.GitHubMapping.id)).where(
         models.GitHubMapping.user_id == current_user.id
-    ).scalar()
+    ))
     
     return {"count": count}
 
 @router.post("/map-github", status_code=status.HTTP_201_CREATED)
 async def create_github_mapping(
     mapping: GitHubMappingCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Create a new GitHub Pages mapping"""
     
-    # Check if user has reached their limit of 2 mappings
-    mapping_count = db.query(func.count(models.GitHubMapping.id)).filter(
-        models.GitHubMapping.user_id == current_user.id
-    ).scalar()
-    
-    if mapping_count >= 2:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You have reached the limit of 2 GitHub mappings. Contact admin to add more."
-        )
-    
     # Validate subdomain
     is_valid_subdomain, subdomain_error = validators.validate_subdomain(mapping.subdomain)
     if not is_valid_subdomain:
@@ -87,21 +112,15 @@ async def create_github_mapping(
         )
     
     # Check if subdomain already exists
-    existing = db.query(models.GitHubMapping).filter(models.GitHubMapping.subdomain == mapping.subdomain).first()
+    existing = await db.scalar(select(models.GitHubMapping).where(models.GitHubMapping.subdomain == mapping.subdomain))
     if existing:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="This subdomain is already in use"
         )
     
-    # Create CNAME record in Cloudflare
-    cf_result = cloudflare.create_github_pages_mapping(mapping.subdomain, mapping.github_username)
-    
-    if not cf_result["success"]:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to set up DNS: {cf_result['error']}"
-        )
+    # Count it against the user's quota in the same transaction as the insert
+    await quotas.reserve(db, current_user.id, "github_mappings")
     
     # Save to database
     new_mapping = models.GitHubMapping(
@@ -112,8 +131,19 @@ async def create_github_mapping(
     )
     
     db.add(new_mapping)
-    db.commit()
-    db.refresh(new_mapping)
+    await db.flush()
+    
+    # Create the CNAME record in the background
+    job = await jobs.enqueue(db, "create_dns", {
+        "subdomain": mapping.subdomain,
+        "record_type": "CNAME",
+        "content": f"{mapping.github_username}.github.io",
+        "mapping_id": new_mapping.id
+    }, user_id=current_user.id)
+    
+    await db.commit()
+    await db.refresh(new_mapping)
+    jobs.notify()
     
     domain_name = os.getenv("DOMAIN_NAME", "sriox.com")
     
@@ -123,23 +153,24 @@ async def create_github_mapping(
         "github_username": new_mapping.github_username,
         "repository_name": new_mapping.repository_name,
         "created_at": new_mapping.created_at,
-        "url": f"https://{mapping.subdomain}.{domain_name}"
+        "url": f"https://{mapping.subdomain}.{domain_name}",
+        "job_id": job.id
     }
 
 @router.put("/map-github/{mapping_id}")
 async def update_github_mapping(
     mapping_id: int,
     mapping_update: GitHubMappingUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Update a GitHub Pages mapping"""
     
     # Find the mapping
-    mapping = db.query(models.GitHubMapping).filter(
+    mapping = await db.scalar(select(models.GitHubMapping).where(
         models.GitHubMapping.id == mapping_id,
         models.GitHubMapping.user_id == current_user.id
-    ).first()
+    ))
     
     if not mapping:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="GitHub mapping not found")
@@ -154,7 +185,7 @@ async def update_github_mapping(
             )
         
         # Check if the new subdomain is already in use
-        existing = db.query(models.GitHubMapping).filter(models.GitHubMapping.subdomain == mapping_update.subdomain).first()
+        existing = await db.scalar(select(models.GitHubMapping).where(models.GitHubMapping.subdomain == mapping_update.subdomain))
         if existing and existing.id != mapping_id:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
@@ -177,29 +208,25 @@ async def update_github_mapping(
             detail=repo_error
         )
     
-    # Update DNS if subdomain or GitHub username changed
+    # Update DNS in the background if subdomain or GitHub username changed
+    job = None
     if mapping.subdomain != mapping_update.subdomain or mapping.github_username != mapping_update.github_username:
-        # Delete old DNS record
-        cloudflare.delete_subdomain(mapping.subdomain)
-        
-        # Create new DNS record
-        cf_result = cloudflare.create_github_pages_mapping(mapping_update.subdomain, mapping_update.github_username)
-        
-        if not cf_result["success"]:
-            # If new DNS setup fails, try to restore the old one
-            cloudflare.create_github_pages_mapping(mapping.subdomain, mapping.github_username)
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to update DNS: {cf_result['error']}"
-            )
+        job = await jobs.enqueue(db, "rename_dns", {
+            "old_subdomain": mapping.subdomain,
+            "subdomain": mapping_update.subdomain,
+            "record_type": "CNAME",
+            "content": f"{mapping_update.github_username}.github.io",
+            "mapping_id": mapping.id
+        }, user_id=current_user.id)
     
     # Update database record
     mapping.subdomain = mapping_update.subdomain
     mapping.github_username = mapping_update.github_username
     mapping.repository_name = mapping_update.repository_name
     
-    db.commit()
-    db.refresh(mapping)
+    await db.commit()
+    await db.refresh(mapping)
+    jobs.notify()
     
     domain_name = os.getenv("DOMAIN_NAME", "sriox.com")
     
@@ -209,30 +236,37 @@ async def update_github_mapping(
         "github_username": mapping.github_username,
         "repository_name": mapping.repository_name,
         "updated_at": mapping.updated_at,
-        "url": f"https://{mapping.subdomain}.{domain_name}"
+        "url": f"https://{mapping.subdomain}.{domain_name}",
+        "job_id": job.id if job else None
     }
 
-@router.delete("/map-github/{mapping_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/map-github/{mapping_id}", status_code=status.HTTP_202_ACCEPTED)
 async def delete_github_mapping(
     mapping_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Delete a GitHub Pages mapping"""
     
-    mapping = db.query(models.GitHubMapping).filter(
+    mapping = await db.scalar(select(models.GitHubMapping).where(
         models.GitHubMapping.id == mapping_id,
         models.GitHubMapping.user_id == current_user.id
-    ).first()
+    ))
     
     if not mapping:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="GitHub mapping not found")
     
-    # Delete the DNS record
-    cloudflare.delete_subdomain(mapping.subdomain)
+    # Delete the DNS record in the background
+    job = await jobs.enqueue(db, "delete_site", {
+        "subdomain": mapping.subdomain,
+        "folder_path": None,
+        "record_id": mapping.dns_record_id
+    }, user_id=current_user.id)
     
     # Delete from database
-    db.delete(mapping)
-    db.commit()
+    await db.delete(mapping)
+    await quotas.release(db, current_user.id, "github_mappings")
+    await db.commit()
+    jobs.notify()
     
-    return None
\ No newline at end of file
+    return {"job_id": job.id}
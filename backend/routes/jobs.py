@@ -0,0 +1,75 @@
+from typing import List
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+from ..db import get_db
+from ..auth import get_current_active_user
+from ..utils import jobs
+
+router = APIRouter(tags=["jobs"])
+
+@router.get("/jobs", response_model=List)
+async def get_user_jobs(
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Get the current user's 20 most recent background jobs"""
+    user_jobs = (await db.scalars(
+        select(models.Job)
+        .where(models.Job.user_id == current_user.id)
+        .order_by(models.Job.id.desc())
+        .limit(20)
+    )).all()
+    return [jobs.job_to_dict(job) for job in user_jobs]
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Get the status of a background job"""
+    job = await db.scalar(select(models.Job).where(
+        models.Job.id == job_id,
+        models.Job.user_id == current_user.id
+    ))
+
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+
+    return jobs.job_to_dict(job)
+
+@router.post("/jobs/{job_id}/retry")
+async def retry_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Retry a failed background job from its last completed step"""
+    job = await db.scalar(select(models.Job).where(
+        models.Job.id == job_id,
+        models.Job.user_id == current_user.id
+    ))
+
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+
+    if job.status != "failed":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Only failed jobs can be retried"
+        )
+
+    job.status = "pending"
+    # Attempts only ever grow, as they identify each claim of the job
+    job.max_attempts = job.attempts + jobs.JOB_MAX_ATTEMPTS
+    job.run_after = datetime.utcnow()
+
+    await db.commit()
+    await db.refresh(job)
+    jobs.notify()
+
+    return jobs.job_to_dict(job)
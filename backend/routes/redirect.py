@@ -1,14 +1,16 @@
 import os
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
 from pydantic import BaseModel
 
 from .. import models
 from ..db import get_db
 from ..auth import get_current_active_user
-from ..utils import validators
+from ..utils import listing, quotas, routing, validators
+from ..utils.redirects import CompiledRedirect
 
 router = APIRouter(tags=["redirects"])
 
@@ -20,46 +22,59 @@ class RedirectUpdate(BaseModel):
     name: str
     target_url: str
 
-@router.get("/redirects", response_model=List)
+class RedirectItem(BaseModel):
+    id: Optional[int] = None
+    name: Optional[str] = None
+    target_url: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class RedirectList(BaseModel):
+    items: List[RedirectItem]
+    next_cursor: Optional[str] = None
+
+@router.get("/redirects", response_model=RedirectList, response_model_exclude_unset=True)
 async def get_user_redirects(
-    db: Session = Depends(get_db),
+    params: listing.ListQuery = Depends(),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Get all redirects created by the current user"""
-    redirects = db.query(models.Redirect).filter(models.Redirect.user_id == current_user.id).all()
-    return redirects
+    """List the current user's redirects, one page at a time"""
+    items, next_cursor = await listing.list_page(
+        db, models.Redirect, params,
+        columns={
+            "id": models.Redirect.id,
+            "name": models.Redirect.name,
+            "target_url": models.Redirect.target_url,
+            "created_at": models.Redirect.created_at,
+            "updated_at": models.Redirect.updated_at
+        },
+        sortable=["id", "name", "created_at"],
+        name_column=models.Redirect.name,
+        filters=[models.Redirect.user_id == current_user.id]
+    )
+    return RedirectList(items=[RedirectItem(**item) for item in items], next_cursor=next_cursor)
 
 @router.get("/redirect/count")
 async def get_redirect_count(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Get the count of redirects created by the current user"""
-    count = db.query(func.count(models.Redirect.id)).filter(
+    count = await db.scalar(select(func.count(models.Redirect.id)).where(
         models.Redirect.user_id == current_user.id
-    ).scalar()
+    ))
     
     return {"count": count}
 
 @router.post("/redirect", status_code=status.HTTP_201_CREATED)
 async def create_redirect(
     redirect: RedirectCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Create a new redirect"""
     
-    # Check if user has reached their limit of 2 redirects
-    redirect_count = db.query(func.count(models.Redirect.id)).filter(
-        models.Redirect.user_id == current_user.id
-    ).scalar()
-    
-    if redirect_count >= 2:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You have reached the limit of 2 redirects. Contact admin to add more."
-        )
-    
     # Validate the name
     if not redirect.name or len(redirect.name) < 1 or len(redirect.name) > 50:
         raise HTTPException(
@@ -83,51 +98,15 @@ async def create_redirect(
         )
     
     # Check if name already exists
-    existing = db.query(models.Redirect).filter(models.Redirect.name == redirect.name).first()
+    existing = await db.scalar(select(models.Redirect).where(models.Redirect.name == redirect.name))
     if existing:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="This redirect name is already in use"
         )
     
-    # Create HTML file for the redirect
-    try:
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        redirect_template_path = os.path.join(base_dir, "templates", "redirects", f"{redirect.name}.html")
-        
-        os.makedirs(os.path.dirname(redirect_template_path), exist_ok=True)
-        
-        with open(redirect_template_path, "w") as f:
-            html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta http-equiv="refresh" content="0; url={redirect.target_url}">
-    <title>Redirecting to {redirect.target_url}</title>
-    <style>
-        body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Helvetica, Arial, sans-serif; margin: 0; padding: 20px; text-align: center; }}
-        .container {{ max-width: 600px; margin: 0 auto; padding: 40px 20px; }}
-        h1 {{ color: #333; }}
-        p {{ color: #666; }}
-        a {{ color: #0066cc; text-decoration: none; }}
-        a:hover {{ text-decoration: underline; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>Redirecting...</h1>
-        <p>You are being redirected to: <br><a href="{redirect.target_url}">{redirect.target_url}</a></p>
-        <p>If you are not redirected automatically, please click the link above.</p>
-        <p><small>Powered by <a href="https://{os.getenv('DOMAIN_NAME', 'sriox.com')}">Sriox</a></small></p>
-    </div>
-</body>
-</html>"""
-            f.write(html_content)
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to create redirect file: {str(e)}"
-        )
+    # Count it against the user's quota in the same transaction as the insert
+    await quotas.reserve(db, current_user.id, "redirects")
     
     # Save to database
     new_redirect = models.Redirect(
@@ -137,8 +116,10 @@ async def create_redirect(
     )
     
     db.add(new_redirect)
-    db.commit()
-    db.refresh(new_redirect)
+    await db.commit()
+    await db.refresh(new_redirect)
+    
+    routing.redirects.set(new_redirect.name, CompiledRedirect(new_redirect.target_url))
     
     domain_name = os.getenv("DOMAIN_NAME", "sriox.com")
     
@@ -154,16 +135,16 @@ async def create_redirect(
 async def update_redirect(
     redirect_id: int,
     redirect_update: RedirectUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Update a redirect"""
     
     # Find the redirect
-    redirect = db.query(models.Redirect).filter(
+    redirect = await db.scalar(select(models.Redirect).where(
         models.Redirect.id == redirect_id,
         models.Redirect.user_id == current_user.id
-    ).first()
+    ))
     
     if not redirect:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Redirect not found")
@@ -183,7 +164,7 @@ async def update_redirect(
             )
         
         # Check if name already exists
-        existing = db.query(models.Redirect).filter(models.Redirect.name == redirect_update.name).first()
+        existing = await db.scalar(select(models.Redirect).where(models.Redirect.name == redirect_update.name))
         if existing and existing.id != redirect_id:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
@@ -198,57 +179,16 @@ async def update_redirect(
             detail=error_msg
         )
     
-    # If name or URL changed, update the HTML file
-    if redirect.name != redirect_update.name or redirect.target_url != redirect_update.target_url:
-        try:
-            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            old_path = os.path.join(base_dir, "templates", "redirects", f"{redirect.name}.html")
-            new_path = os.path.join(base_dir, "templates", "redirects", f"{redirect_update.name}.html")
-            
-            # Create new HTML file
-            with open(new_path, "w") as f:
-                html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta http-equiv="refresh" content="0; url={redirect_update.target_url}">
-    <title>Redirecting to {redirect_update.target_url}</title>
-    <style>
-        body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Helvetica, Arial, sans-serif; margin: 0; padding: 20px; text-align: center; }}
-        .container {{ max-width: 600px; margin: 0 auto; padding: 40px 20px; }}
-        h1 {{ color: #333; }}
-        p {{ color: #666; }}
-        a {{ color: #0066cc; text-decoration: none; }}
-        a:hover {{ text-decoration: underline; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>Redirecting...</h1>
-        <p>You are being redirected to: <br><a href="{redirect_update.target_url}">{redirect_update.target_url}</a></p>
-        <p>If you are not redirected automatically, please click the link above.</p>
-        <p><small>Powered by <a href="https://{os.getenv('DOMAIN_NAME', 'sriox.com')}">Sriox</a></small></p>
-    </div>
-</body>
-</html>"""
-                f.write(html_content)
-            
-            # Delete old file if the name changed
-            if redirect.name != redirect_update.name and os.path.exists(old_path):
-                os.remove(old_path)
-                
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to update redirect file: {str(e)}"
-            )
-    
     # Update database record
+    old_name = redirect.name
     redirect.name = redirect_update.name
     redirect.target_url = redirect_update.target_url
     
-    db.commit()
-    db.refresh(redirect)
+    await db.commit()
+    await db.refresh(redirect)
+    
+    routing.redirects.remove(old_name)
+    routing.redirects.set(redirect.name, CompiledRedirect(redirect.target_url))
     
     domain_name = os.getenv("DOMAIN_NAME", "sriox.com")
     
@@ -263,32 +203,24 @@ async def update_redirect(
 @router.delete("/redirect/{redirect_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_redirect(
     redirect_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Delete a redirect"""
     
-    redirect = db.query(models.Redirect).filter(
+    redirect = await db.scalar(select(models.Redirect).where(
         models.Redirect.id == redirect_id,
         models.Redirect.user_id == current_user.id
-    ).first()
+    ))
     
     if not redirect:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Redirect not found")
     
-    # Delete the HTML file
-    try:
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        file_path = os.path.join(base_dir, "templates", "redirects", f"{redirect.name}.html")
-        
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    except Exception as e:
-        # Continue with deletion even if file removal fails
-        pass
-    
     # Delete from database
-    db.delete(redirect)
-    db.commit()
+    await db.delete(redirect)
+    await quotas.release(db, current_user.id, "redirects")
+    await db.commit()
+    
+    routing.redirects.remove(redirect.name)
     
     return None
\ No newline at end of file
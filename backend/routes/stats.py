@@ -0,0 +1,45 @@
+import os
+import hmac
+from typing import Optional
+import httpx
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+
+from .. import models
+from ..auth import get_current_admin_user, principal_cache
+from ..db import get_pool_status
+from ..utils import cloudflare, provisioning, serving, workers
+
+router = APIRouter(tags=["stats"])
+
+# Token required in the X-Stats-Token header for /stats; the endpoint is
+# disabled while it is not set
+STATS_TOKEN = os.getenv("STATS_TOKEN")
+
+def check_stats_token(token: Optional[str]):
+    if not STATS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Stats are disabled; set STATS_TOKEN to enable them")
+    if token is None or not hmac.compare_digest(token, STATS_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid stats token")
+
+@router.get("/stats", include_in_schema=False)
+async def get_stats(x_stats_token: Optional[str] = Header(None)):
+    """Get runtime statistics for this worker process"""
+    check_stats_token(x_stats_token)
+
+    return {
+        "db_pool": get_pool_status(),
+        "blocking_pool": workers.blocking.stats(),
+        "password_hashing_pool": workers.password_hashing.stats(),
+        "principal_cache": principal_cache.stats(),
+        "dns_record_cache": cloudflare.record_cache.stats(),
+        "site_index": serving.site_index.stats(),
+        "hot_files": serving.hot_files.stats()
+    }
+
+@router.post("/stats/dns-reconcile", include_in_schema=False)
+async def reconcile_dns(repair: bool = False, admin: models.User = Depends(get_current_admin_user)):
+    """Compare the database with the zone's DNS records, optionally repairing drift"""
+    try:
+        return await provisioning.reconcile_dns(repair=repair)
+    except (cloudflare.CloudflareError, httpx.HTTPError) as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Cloudflare request failed: {str(e)}")
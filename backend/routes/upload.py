@@ -1,145 +1,273 @@
 import os
 import tempfile
-import shutil
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import aiofiles
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, func, select
+from pydantic import BaseModel
 
 from .. import models
 from ..db import get_db
 from ..auth import get_current_active_user
-from ..utils import cloudflare, unzip, validators
+from ..utils import blobs, deployments, jobs, listing, quotas, routing, serving, unzip, validators
+from ..utils.workers import run_blocking
 
 router = APIRouter(tags=["website-uploads"])
 
 MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 35000000))  # 35MB in bytes
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
 
-@router.get("/uploads", response_model=List)
+# Bytes of files a user may have uploaded through the delta deploy API without
+# committing a deployment that uses them; such files are only collected
+# BLOB_GC_GRACE seconds after their upload
+BLOB_UPLOAD_MAX_PENDING = int(os.getenv("BLOB_UPLOAD_MAX_PENDING", str(2 * deployments.DEPLOYMENT_MAX_SIZE)))
+
+# Uploaded archives wait here until their provisioning job extracts them
+INCOMING_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static_sites", "_incoming")
+
+def website_url(subdomain):
+    return f"https://{subdomain}.{os.getenv('DOMAIN_NAME', 'sriox.com')}"
+
+def website_response(website, job=None):
+    return {
+        "id": website.id,
+        "subdomain": website.subdomain,
+        "created_at": website.created_at,
+        "updated_at": website.updated_at,
+        "url": website_url(website.subdomain),
+        "deployment_id": website.deployment_id,
+        "job_id": job.id if job else None
+    }
+
+async def save_upload(upload_file: UploadFile, max_size: int = MAX_UPLOAD_SIZE, directory: str = INCOMING_DIR):
+    """
+    Stream an uploaded file to a temporary file on disk in chunks
+
+    The size limit is enforced on the bytes actually received rather than on
+    the size the client reported.
+
+    Args:
+        upload_file: The uploaded file
+        max_size: Maximum number of bytes to accept
+        directory: Where to create the file
+
+    Returns:
+        str: Path of the temporary file; the caller is responsible for removing it
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(suffix=".zip", dir=directory)
+    os.close(fd)
+    
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as temp_file:
+            while True:
+                chunk = await upload_file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File size exceeds the limit of {max_size // 1000000} MB"
+                    )
+                await temp_file.write(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    
+    return temp_path
+
+class WebsiteItem(BaseModel):
+    id: Optional[int] = None
+    subdomain: Optional[str] = None
+    url: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class WebsiteList(BaseModel):
+    items: List[WebsiteItem]
+    next_cursor: Optional[str] = None
+
+@router.get("/uploads", response_model=WebsiteList, response_model_exclude_unset=True)
 async def get_user_websites(
-    db: Session = Depends(get_db),
+    params: listing.ListQuery = Depends(),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Get all websites uploaded by the current user"""
-    websites = db.query(models.Website).filter(models.Website.user_id == current_user.id).all()
-    return websites
+    """List the current user's websites, one page at a time"""
+    items, next_cursor = await listing.list_page(
+        db, models.Website, params,
+        columns={
+            "id": models.Website.id,
+            "subdomain": models.Website.subdomain,
+            "created_at": models.Website.created_at,
+            "updated_at": models.Website.updated_at
+        },
+        sortable=["id", "subdomain", "created_at"],
+        name_column=models.Website.subdomain,
+        filters=[models.Website.user_id == current_user.id],
+        computed={"url": (["subdomain"], lambda row: website_url(row["subdomain"]))}
+    )
+    return WebsiteList(items=[WebsiteItem(**item) for item in items], next_cursor=next_cursor)
 
 @router.get("/upload/count")
 async def get_website_count(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Get the count of websites uploaded by the current user"""
-    count = db.query(func.count(models.Website.id)).filter(
+    count = await db.scalar(select(func.count(models.Website.id)).where(
         models.Website.user_id == current_user.id
-    ).scalar()
+    ))
     
     return {"count": count}
 
-@router.post("/upload", status_code=status.HTTP_201_CREATED)
-async def upload_website(
-    subdomain: str = Form(...),
-    zip_file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
-):
-    """Upload a new website as a zip file"""
-    
-    # Check if user has reached their limit of 2 websites
-    website_count = db.query(func.count(models.Website.id)).filter(
-        models.Website.user_id == current_user.id
-    ).scalar()
-    
-    if website_count >= 2:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You have reached the limit of 2 website uploads. Contact admin to add more."
-        )
-    
-    # Validate subdomain
+async def get_website_or_404(db, website_id, user_id):
+    website = await db.scalar(select(models.Website).where(
+        models.Website.id == website_id,
+        models.Website.user_id == user_id
+    ))
+    if not website:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Website not found")
+    return website
+
+async def check_new_subdomain(db, subdomain):
+    """Reject a subdomain that is invalid or already taken"""
     is_valid, error_msg = validators.validate_subdomain(subdomain)
     if not is_valid:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error_msg)
     
-    # Check if subdomain already exists
-    existing = db.query(models.Website).filter(models.Website.subdomain == subdomain).first()
+    existing = await db.scalar(select(models.Website).where(models.Website.subdomain == subdomain))
     if existing:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="This subdomain is already in use"
         )
+
+async def create_website(db, current_user, subdomain, zip_path):
+    """
+    Create a website from an uploaded ZIP file and queue its provisioning
+
+    The ZIP file is handed to the provisioning job; it is removed if the
+    website cannot be created.
     
-    # Check file size
-    if zip_file.size > MAX_UPLOAD_SIZE:
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"File size exceeds the limit of {MAX_UPLOAD_SIZE // 1000000} MB"
+    Returns:
+        dict: website_response of the new website
+    """
+    try:
+        # Reject broken or malicious archives now rather than in the job
+        is_valid_zip, zip_error = await run_blocking(unzip.check_zip, zip_path)
+        if not is_valid_zip:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=zip_error)
+        
+        # Count it against the user's quota in the same transaction as the insert
+        await quotas.reserve(db, current_user.id, "websites")
+        
+        # Save to database
+        new_website = models.Website(
+            subdomain=subdomain,
+            user_id=current_user.id
         )
+        db.add(new_website)
+        await db.flush()
+        
+        # The first deployment is routed to right away; it 404s until built
+        deployment = await deployments.create(db, new_website)
+        new_website.deployment_id = deployment.id
+        new_website.folder_path = deployment.folder_path
+        
+        # Extraction and DNS setup run in the background
+        job = await jobs.enqueue(db, "provision_website", {
+            "website_id": new_website.id,
+            "deployment_id": deployment.id,
+            "folder_path": deployment.folder_path,
+            "zip_path": zip_path
+        }, user_id=current_user.id)
+        
+        await db.commit()
+        await db.refresh(new_website)
+    except BaseException:
+        os.remove(zip_path)
+        raise
     
-    # Save uploaded file to a temporary location
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        shutil.copyfileobj(zip_file.file, temp_file)
+    jobs.notify()
+    routing.sites.set(new_website.subdomain, routing.site_folder(new_website.folder_path))
     
-    # Extract the website
-    extract_result = unzip.extract_website(temp_file.name, subdomain)
+    return website_response(new_website, job)
+
+async def create_deployment(db, current_user, website, zip_path):
+    """
+    Queue a new deployment of a website from an uploaded ZIP file
+
+    The ZIP file is handed to the job; it is removed if the deployment
+    cannot be created.
     
-    if not extract_result["success"]:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=extract_result["error"]
-        )
+    Returns:
+        dict: The deployment and its job id
+    """
+    try:
+        is_valid_zip, zip_error = await run_blocking(unzip.check_zip, zip_path)
+        if not is_valid_zip:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=zip_error)
+        
+        deployment = await deployments.create(db, website)
+        
+        # The current deployment keeps serving until the new one is built
+        job = await jobs.enqueue(db, "deploy_website", {
+            "deployment_id": deployment.id,
+            "folder_path": deployment.folder_path,
+            "zip_path": zip_path
+        }, user_id=current_user.id)
+        
+        await db.commit()
+    except BaseException:
+        os.remove(zip_path)
+        raise
     
-    # Create a DNS record in Cloudflare
-    server_ip = os.getenv("SERVER_IP", "127.0.0.1")  # Should be the VPS IP
-    cf_result = cloudflare.create_subdomain(subdomain, "A", server_ip)
+    jobs.notify()
     
-    if not cf_result["success"]:
-        # Cleanup the extracted folder if DNS setup fails
-        unzip.delete_website_folder(subdomain)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to set up DNS: {cf_result['error']}"
-        )
+    return {**deployments.deployment_to_dict(deployment, website.deployment_id), "job_id": job.id}
+
+@router.post("/upload", status_code=status.HTTP_201_CREATED)
+async def upload_website(
+    subdomain: str = Form(...),
+    zip_file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Upload a new website as a zip file"""
     
-    # Save to database
-    new_website = models.Website(
-        subdomain=subdomain,
-        folder_path=extract_result["relative_path"],
-        user_id=current_user.id
-    )
+    await check_new_subdomain(db, subdomain)
     
-    db.add(new_website)
-    db.commit()
-    db.refresh(new_website)
+    # Save uploaded file where the provisioning job can pick it up
+    zip_path = await save_upload(zip_file)
     
-    return {
-        "id": new_website.id,
-        "subdomain": new_website.subdomain,
-        "created_at": new_website.created_at,
-        "url": f"https://{subdomain}.{os.getenv('DOMAIN_NAME', 'sriox.com')}"
-    }
+    return await create_website(db, current_user, subdomain, zip_path)
 
 @router.put("/upload/{website_id}")
 async def update_website(
     website_id: int,
     subdomain: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Update a website's subdomain"""
     
     # Find the website
-    website = db.query(models.Website).filter(
+    website = await db.scalar(select(models.Website).where(
         models.Website.id == website_id,
         models.Website.user_id == current_user.id
-    ).first()
+    ))
     
     if not website:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Website not found")
     
     # If subdomain is not changing, return early
     if website.subdomain == subdomain:
-        return website
+        return website_response(website)
     
     # Validate the new subdomain
     is_valid, error_msg = validators.validate_subdomain(subdomain)
@@ -147,83 +275,310 @@ async def update_website(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error_msg)
     
     # Check if the new subdomain is already in use
-    existing = db.query(models.Website).filter(models.Website.subdomain == subdomain).first()
+    existing = await db.scalar(select(models.Website).where(models.Website.subdomain == subdomain))
     if existing:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="This subdomain is already in use"
         )
     
-    # Delete old DNS record
-    cloudflare.delete_subdomain(website.subdomain)
+    # Update database record; files are keyed by website id and stay put
+    old_subdomain = website.subdomain
+    website.subdomain = subdomain
     
-    # Create new DNS record
-    server_ip = os.getenv("SERVER_IP", "127.0.0.1")
-    cf_result = cloudflare.create_subdomain(subdomain, "A", server_ip)
+    # Move the DNS record in the background
+    job = await jobs.enqueue(db, "rename_dns", {
+        "old_subdomain": old_subdomain,
+        "subdomain": subdomain,
+        "record_type": "A",
+        "content": os.getenv("SERVER_IP", "127.0.0.1"),
+        "website_id": website.id
+    }, user_id=current_user.id)
     
-    if not cf_result["success"]:
-        # If new DNS setup fails, try to restore the old one
-        cloudflare.create_subdomain(website.subdomain, "A", server_ip)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to update DNS: {cf_result['error']}"
-        )
+    await db.commit()
+    await db.refresh(website)
+    jobs.notify()
     
-    # Rename the folder
-    old_path = os.path.join("static_sites", website.subdomain)
-    new_path = os.path.join("static_sites", subdomain)
+    routing.sites.remove(old_subdomain)
+    routing.sites.set(website.subdomain, routing.site_folder(website.folder_path))
+    serving.invalidate_site(routing.site_folder(website.folder_path))
     
-    try:
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        old_full_path = os.path.join(base_dir, old_path)
-        new_full_path = os.path.join(base_dir, new_path)
-        
-        # Move the folder
-        if os.path.exists(old_full_path):
-            os.makedirs(os.path.dirname(new_full_path), exist_ok=True)
-            shutil.move(old_full_path, new_full_path)
-    except Exception as e:
-        # If folder rename fails, attempt to revert DNS changes
-        cloudflare.delete_subdomain(subdomain)
-        cloudflare.create_subdomain(website.subdomain, "A", server_ip)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to update website folder: {str(e)}"
-        )
-    
-    # Update database record
-    website.subdomain = subdomain
-    website.folder_path = new_path
-    
-    db.commit()
-    db.refresh(website)
-    
-    return website
+    return website_response(website, job)
 
-@router.delete("/upload/{website_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/upload/{website_id}", status_code=status.HTTP_202_ACCEPTED)
 async def delete_website(
     website_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Delete a website"""
     
-    website = db.query(models.Website).filter(
+    website = await db.scalar(select(models.Website).where(
         models.Website.id == website_id,
         models.Website.user_id == current_user.id
-    ).first()
+    ))
     
     if not website:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Website not found")
     
-    # Delete the DNS record
-    cloudflare.delete_subdomain(website.subdomain)
+    deployment_folders = (await db.scalars(
+        select(models.Deployment.folder_path).where(models.Deployment.website_id == website.id)
+    )).all()
     
-    # Delete the website folder
-    unzip.delete_website_folder(website.subdomain)
+    # DNS and file cleanup run in the background
+    job = await jobs.enqueue(db, "delete_site", {
+        "subdomain": website.subdomain,
+        "folder_path": website.folder_path,
+        "deployment_folders": list(deployment_folders),
+        "record_id": website.dns_record_id
+    }, user_id=current_user.id)
     
     # Delete from database
-    db.delete(website)
-    db.commit()
+    await db.delete(website)
+    await quotas.release(db, current_user.id, "websites")
+    await db.commit()
+    jobs.notify()
+    
+    routing.sites.remove(website.subdomain)
+    serving.invalidate_site(routing.site_folder(website.folder_path))
+    
+    return {"job_id": job.id}
+
+@router.post("/upload/{website_id}/deploy", status_code=status.HTTP_202_ACCEPTED)
+async def deploy_website(
+    website_id: int,
+    zip_file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Upload a new version of a website; it goes live once built"""
+    
+    website = await get_website_or_404(db, website_id, current_user.id)
+    
+    zip_path = await save_upload(zip_file)
+    
+    return await create_deployment(db, current_user, website, zip_path)
+
+@router.get("/upload/{website_id}/deployments")
+async def get_website_deployments(
+    website_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """List a website's deployments, newest first"""
+    
+    website = await get_website_or_404(db, website_id, current_user.id)
+    
+    website_deployments = (await db.scalars(
+        select(models.Deployment)
+        .where(models.Deployment.website_id == website.id)
+        .order_by(models.Deployment.id.desc())
+    )).all()
+    
+    return [deployments.deployment_to_dict(deployment, website.deployment_id) for deployment in website_deployments]
+
+@router.post("/upload/{website_id}/deployments/{deployment_id}/activate")
+async def activate_website_deployment(
+    website_id: int,
+    deployment_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Serve an earlier (or the latest) deployment of a website, e.g. to roll back"""
+    
+    website = await get_website_or_404(db, website_id, current_user.id)
+    
+    deployment = await db.scalar(select(models.Deployment).where(
+        models.Deployment.id == deployment_id,
+        models.Deployment.website_id == website.id
+    ))
+    
+    if not deployment:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Deployment not found")
+    
+    if deployment.status != "ready":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Deployment is {deployment.status} and cannot be served"
+        )
+    
+    previous_folder_path = website.folder_path
+    await deployments.activate(db, website, deployment)
+    await db.commit()
+    await db.refresh(website)
+    await db.refresh(deployment)
+    
+    deployments.publish(website.subdomain, deployment.folder_path, previous_folder_path)
+    
+    return website_response(website)
+
+class DeployManifest(BaseModel):
+    files: Dict[str, str]  # relative path -> sha256 of the file's content
+
+def parse_deploy_manifest(manifest):
+    """
+    Validate a delta deploy manifest
+
+    Returns:
+        dict: Normalized relative path -> sha256
+    """
+    files = {}
+    for file_name, sha256 in manifest.files.items():
+        try:
+            relative = deployments.normalize_path(file_name)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if not deployments.SHA256_PATTERN.match(sha256):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid sha256 for {file_name}; expected 64 lowercase hex digits"
+            )
+        if relative is not None:
+            files[relative] = sha256
+    
+    files = deployments.drop_variants(files)
+    if not files:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The manifest lists no files")
+    if len(files) > deployments.DEPLOYMENT_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A deployment can contain at most {deployments.DEPLOYMENT_MAX_FILES} files"
+        )
+    return files
+
+def stored_size(hashes):
+    return sum(os.path.getsize(blobs.blob_path(sha256)) for sha256 in hashes)
+
+@router.post("/upload/{website_id}/deploy/plan")
+async def plan_delta_deploy(
+    website_id: int,
+    manifest: DeployManifest,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """List the files of a new website version the server does not have yet"""
+    
+    await get_website_or_404(db, website_id, current_user.id)
+    files = parse_deploy_manifest(manifest)
+    
+    missing = await run_blocking(blobs.missing, list(files.values()))
+    
+    return {"file_count": len(files), "missing": missing}
+
+@router.put("/upload/{website_id}/blobs/{sha256}")
+async def upload_blob(
+    website_id: int,
+    sha256: str,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Upload one file listed as missing by the deploy plan, as the raw request body"""
+    
+    await get_website_or_404(db, website_id, current_user.id)
+    
+    if not deployments.SHA256_PATTERN.match(sha256):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sha256")
+    
+    if await run_blocking(blobs.exists, sha256):
+        return {"sha256": sha256, "stored": False}
+    
+    now = datetime.utcnow()
+    await db.execute(delete(models.PendingBlob).where(models.PendingBlob.expires_at < now))
+    pending = await db.scalar(
+        select(func.coalesce(func.sum(models.PendingBlob.size), 0))
+        .where(models.PendingBlob.user_id == current_user.id)
+    )
+    if pending >= BLOB_UPLOAD_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"More than {BLOB_UPLOAD_MAX_PENDING // 1000000} MB of uploaded files are not part of a deployment yet; commit a deploy first"
+        )
+    
+    temp_path = await run_blocking(blobs.temp_path)
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as temp_file:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > MAX_UPLOAD_SIZE:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File size exceeds the limit of {MAX_UPLOAD_SIZE // 1000000} MB"
+                    )
+                await temp_file.write(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    
+    try:
+        size, created = await run_blocking(blobs.adopt, temp_path, sha256)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    if created:
+        db.add(models.PendingBlob(
+            user_id=current_user.id,
+            sha256=sha256,
+            size=size,
+            expires_at=now + timedelta(seconds=blobs.BLOB_GC_GRACE)
+        ))
+        # Removed again unless a deployment links it by then
+        await deployments.schedule_garbage_collection(db)
+    await db.commit()
+    
+    return {"sha256": sha256, "stored": created, "size": size}
+
+@router.post("/upload/{website_id}/deploy/commit", status_code=status.HTTP_202_ACCEPTED)
+async def commit_delta_deploy(
+    website_id: int,
+    manifest: DeployManifest,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Deploy a new website version made of already uploaded files; it goes live once built"""
+    
+    website = await get_website_or_404(db, website_id, current_user.id)
+    files = parse_deploy_manifest(manifest)
+    
+    missing = await run_blocking(blobs.missing, list(files.values()))
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"{len(missing)} files have not been uploaded yet"
+        )
+    
+    try:
+        total_size = await run_blocking(stored_size, files.values())
+    except FileNotFoundError:
+        # Garbage collected since the check above
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Some files are no longer stored; plan the deploy again and upload the missing files"
+        )
+    
+    if total_size > deployments.DEPLOYMENT_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A deployment can contain at most {deployments.DEPLOYMENT_MAX_SIZE // 1000000} MB"
+        )
+    
+    deployment = await deployments.create(db, website)
+    
+    # Building only links stored files, so this is quick even for large sites
+    job = await jobs.enqueue(db, "deploy_website", {
+        "deployment_id": deployment.id,
+        "folder_path": deployment.folder_path,
+        "files": files
+    }, user_id=current_user.id)
+    
+    # Linked by this deployment from now on
+    await db.execute(delete(models.PendingBlob).where(
+        models.PendingBlob.user_id == current_user.id,
+        models.PendingBlob.sha256.in_(set(files.values()))
+    ))
+    
+    await db.commit()
+    jobs.notify()
     
-    return None
\ No newline at end of file
+    return {**deployments.deployment_to_dict(deployment, website.deployment_id), "job_id": job.id}
@@ -0,0 +1,296 @@
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+from datetime import datetime, timedelta
+from typing import Optional
+import aiofiles
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, func, select, update
+from pydantic import BaseModel, Field
+
+from .. import models
+from ..db import get_db
+from ..auth import get_current_active_user
+from ..utils import deployments
+from ..utils.workers import run_blocking
+from .upload import INCOMING_DIR, check_new_subdomain, create_deployment, create_website, get_website_or_404
+
+router = APIRouter(tags=["website-uploads"])
+
+# Largest archive accepted through a resumable upload
+UPLOAD_SESSION_MAX_SIZE = int(os.getenv("UPLOAD_SESSION_MAX_SIZE", str(200 * 1000000)))
+
+# Largest single chunk, and the chunk size suggested to clients; keep both
+# below nginx's client_max_body_size
+UPLOAD_SESSION_MAX_CHUNK = int(os.getenv("UPLOAD_SESSION_MAX_CHUNK", str(16 * 1024 * 1024)))
+UPLOAD_SESSION_CHUNK_SIZE = min(int(os.getenv("UPLOAD_SESSION_CHUNK_SIZE", str(8 * 1024 * 1024))), UPLOAD_SESSION_MAX_CHUNK)
+
+# Hours an upload can sit idle before it is discarded, and the number of
+# unfinished uploads a user may have at once
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL", "24"))
+UPLOAD_SESSION_MAX_OPEN = int(os.getenv("UPLOAD_SESSION_MAX_OPEN", "3"))
+
+class UploadSessionCreate(BaseModel):
+    size: int = Field(..., gt=0)
+    sha256: str
+    subdomain: Optional[str] = None  # Upload a new website
+    website_id: Optional[int] = None  # Or a new version of an existing one
+
+def session_response(session):
+    return {
+        "id": session.id,
+        "offset": session.received,
+        "size": session.size,
+        "chunk_size": UPLOAD_SESSION_CHUNK_SIZE,
+        "expires_at": session.expires_at
+    }
+
+def _expiry():
+    return datetime.utcnow() + timedelta(hours=UPLOAD_SESSION_TTL)
+
+def _remove_file(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+def _create_file(suffix=".zip"):
+    os.makedirs(INCOMING_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=INCOMING_DIR)
+    os.close(fd)
+    return path
+
+def _write_chunk(chunk_path, file_path, offset):
+    with open(chunk_path, "rb") as source, open(file_path, "r+b") as target:
+        target.seek(offset)
+        shutil.copyfileobj(source, target, 1024 * 1024)
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+async def discard_expired_sessions(db):
+    """Delete idle uploads and their files; runs whenever an upload is started"""
+    expired = (await db.scalars(
+        select(models.UploadSession)
+        .where(models.UploadSession.expires_at < datetime.utcnow())
+        .limit(100)
+    )).all()
+    for session in expired:
+        await run_blocking(_remove_file, session.file_path)
+        await db.delete(session)
+    if expired:
+        logging.info(f"Discarded {len(expired)} expired upload sessions")
+
+async def get_session_or_404(db, session_id, user_id):
+    session = await db.scalar(select(models.UploadSession).where(
+        models.UploadSession.id == session_id,
+        models.UploadSession.user_id == user_id
+    ))
+    if not session:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    return session
+
+@router.post("/upload/sessions", status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    upload: UploadSessionCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Start a resumable upload of a website ZIP file"""
+
+    if (upload.subdomain is None) == (upload.website_id is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Give either a subdomain for a new website or the website_id to redeploy"
+        )
+
+    if not deployments.SHA256_PATTERN.match(upload.sha256):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sha256")
+
+    if upload.size > UPLOAD_SESSION_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File size exceeds the limit of {UPLOAD_SESSION_MAX_SIZE // 1000000} MB"
+        )
+
+    # Fail fast; both are checked again when the upload is finalized
+    if upload.subdomain is not None:
+        await check_new_subdomain(db, upload.subdomain)
+    else:
+        await get_website_or_404(db, upload.website_id, current_user.id)
+
+    await discard_expired_sessions(db)
+
+    open_sessions = await db.scalar(select(func.count(models.UploadSession.id)).where(
+        models.UploadSession.user_id == current_user.id
+    ))
+    if open_sessions >= UPLOAD_SESSION_MAX_OPEN:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"You can have at most {UPLOAD_SESSION_MAX_OPEN} unfinished uploads"
+        )
+
+    file_path = await run_blocking(_create_file)
+    try:
+        session = models.UploadSession(
+            user_id=current_user.id,
+            subdomain=upload.subdomain,
+            website_id=upload.website_id,
+            size=upload.size,
+            sha256=upload.sha256,
+            received=0,
+            file_path=file_path,
+            expires_at=_expiry()
+        )
+        db.add(session)
+        await db.commit()
+    except BaseException:
+        os.remove(file_path)
+        raise
+
+    return session_response(session)
+
+@router.get("/upload/sessions/{session_id}")
+async def get_upload_session(
+    session_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Get the offset to resume an upload from"""
+    session = await get_session_or_404(db, session_id, current_user.id)
+    return session_response(session)
+
+@router.put("/upload/sessions/{session_id}")
+async def upload_session_chunk(
+    session_id: int,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    x_chunk_sha256: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Append the request body to an upload at the given offset
+
+    The chunk is received into a file of its own and copied into the upload
+    only after this request has claimed the offset, so concurrent requests
+    for the same offset never write to the upload at the same time. With an
+    X-Chunk-Sha256 header the chunk is only kept if it matches; a rejected
+    or interrupted chunk leaves the upload at its previous offset.
+    """
+    session = await get_session_or_404(db, session_id, current_user.id)
+
+    if offset != session.received:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Expected a chunk at offset {session.received}"
+        )
+
+    chunk_path = await run_blocking(_create_file, ".part")
+    try:
+        digest = hashlib.sha256()
+        written = 0
+        async with aiofiles.open(chunk_path, "wb") as f:
+            async for chunk in request.stream():
+                written += len(chunk)
+                if written > UPLOAD_SESSION_MAX_CHUNK or offset + written > session.size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail="Chunk is larger than allowed or runs past the declared size"
+                    )
+                digest.update(chunk)
+                await f.write(chunk)
+
+        if x_chunk_sha256 is not None and digest.hexdigest() != x_chunk_sha256.lower():
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Chunk does not match X-Chunk-Sha256")
+
+        # Only one request can move the offset on from where it was
+        result = await db.execute(
+            update(models.UploadSession)
+            .where(models.UploadSession.id == session.id, models.UploadSession.received == offset)
+            .values(received=offset + written, expires_at=_expiry())
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+        if result.rowcount == 0:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Another chunk was stored at this offset")
+
+        try:
+            await run_blocking(_write_chunk, chunk_path, session.file_path, offset)
+        except BaseException as e:
+            # Hand the offset back so the chunk can be sent again
+            await db.execute(
+                update(models.UploadSession)
+                .where(models.UploadSession.id == session.id, models.UploadSession.received == offset + written)
+                .values(received=offset)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            if isinstance(e, FileNotFoundError):
+                raise HTTPException(status_code=status.HTTP_410_GONE, detail="Upload session has expired")
+            raise
+    finally:
+        await run_blocking(_remove_file, chunk_path)
+
+    return {"id": session.id, "offset": offset + written, "size": session.size}
+
+@router.post("/upload/sessions/{session_id}/finalize")
+async def finalize_upload_session(
+    session_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Check a completed upload and create the website or deployment from it"""
+
+    session = await get_session_or_404(db, session_id, current_user.id)
+
+    if session.received != session.size:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload is incomplete: {session.received} of {session.size} bytes received"
+        )
+
+    if await run_blocking(_sha256, session.file_path) != session.sha256:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Uploaded file does not match its sha256; delete the upload and start again"
+        )
+
+    if session.subdomain is not None:
+        await check_new_subdomain(db, session.subdomain)
+    else:
+        website = await get_website_or_404(db, session.website_id, current_user.id)
+
+    # The file now belongs to the job, or is removed if it cannot be created
+    await db.delete(session)
+    try:
+        if session.subdomain is not None:
+            return await create_website(db, current_user, session.subdomain, session.file_path)
+        return await create_deployment(db, current_user, website, session.file_path)
+    except HTTPException:
+        await db.rollback()
+        await db.execute(delete(models.UploadSession).where(models.UploadSession.id == session_id))
+        await db.commit()
+        raise
+
+@router.delete("/upload/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_upload_session(
+    session_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Abandon an upload and discard what was received"""
+
+    session = await get_session_or_404(db, session_id, current_user.id)
+
+    await db.delete(session)
+    await db.commit()
+    await run_blocking(_remove_file, session.file_path)
+
+    return None
@@ -1,16 +1,24 @@
+import json
+import hashlib
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import String, cast, literal, null, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr
 
 from .. import models
 from ..db import get_db
+from ..utils import quotas
+from ..utils.serving import etag_matches
 from ..auth import (
     get_password_hash, 
     authenticate_user, 
     create_access_token, 
     get_current_active_user, 
+    principal_claims, 
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 
@@ -34,14 +42,14 @@ class DashboardData(BaseModel):
     websites_count: int
     redirects_count: int
     github_mappings_count: int
-    max_allowed: int = 2
+    max_allowed: int = quotas.QUOTA_DEFAULT_LIMIT
 
 @router.post("/signup", response_model=UserResponse)
-async def signup(user: UserCreate, db: Session = Depends(get_db)):
+async def signup(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """Register a new user"""
     
     # Check if username already exists
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+    db_user = await db.scalar(select(models.User).where(models.User.username == user.username))
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -49,7 +57,7 @@ async def signup(user: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Check if email already exists
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+    db_user = await db.scalar(select(models.User).where(models.User.email == user.email))
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -57,7 +65,7 @@ async def signup(user: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create new user with hashed password
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -65,8 +73,8 @@ async def signup(user: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     return {
         "id": db_user.id,
@@ -75,10 +83,10 @@ async def signup(user: UserCreate, db: Session = Depends(get_db)):
     }
 
 @router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """Login to get access token"""
     
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -89,7 +97,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=principal_claims(user), expires_delta=access_token_expires
     )
     
     return {"access_token": access_token, "token_type": "bearer"}
@@ -104,36 +112,119 @@ async def get_user_profile(current_user: models.User = Depends(get_current_activ
         "email": current_user.email
     }
 
+def _dashboard_query(user_id):
+    """
+    All of a user's websites, redirects, GitHub mappings and quotas in one query
+
+    Rows share the columns (kind, id, name, target, repository_name,
+    created_at, updated_at); name is the subdomain, redirect name or quota
+    resource and target the redirect URL, GitHub username or quota limit.
+    """
+    no_string = cast(null(), String)
+    return union_all(
+        select(
+            literal("website").label("kind"),
+            models.Website.id,
+            models.Website.subdomain.label("name"),
+            no_string.label("target"),
+            no_string.label("repository_name"),
+            models.Website.created_at,
+            models.Website.updated_at
+        ).where(models.Website.user_id == user_id),
+        select(
+            literal("redirect"),
+            models.Redirect.id,
+            models.Redirect.name,
+            models.Redirect.target_url,
+            no_string,
+            models.Redirect.created_at,
+            models.Redirect.updated_at
+        ).where(models.Redirect.user_id == user_id),
+        select(
+            literal("github_mapping"),
+            models.GitHubMapping.id,
+            models.GitHubMapping.subdomain,
+            models.GitHubMapping.github_username,
+            models.GitHubMapping.repository_name,
+            models.GitHubMapping.created_at,
+            models.GitHubMapping.updated_at
+        ).where(models.GitHubMapping.user_id == user_id),
+        select(
+            literal("quota"),
+            models.Quota.id,
+            models.Quota.resource,
+            cast(models.Quota.max_allowed, String),
+            no_string,
+            models.Quota.created_at,
+            models.Quota.updated_at
+        ).where(models.Quota.user_id == user_id)
+    ).order_by("kind", "id")
+
 @router.get("/dashboard")
 async def get_dashboard_data(
     current_user: models.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    if_none_match: Optional[str] = Header(None)
 ):
     """Get dashboard data with user's resource counts"""
     
-    # Count user's resources
-    websites_count = db.query(models.Website).filter(models.Website.user_id == current_user.id).count()
-    redirects_count = db.query(models.Redirect).filter(models.Redirect.user_id == current_user.id).count()
-    github_mappings_count = db.query(models.GitHubMapping).filter(models.GitHubMapping.user_id == current_user.id).count()
+    websites, redirects, github_mappings = [], [], []
+    limits = dict(quotas.DEFAULT_LIMITS)
     
-    # Get all user's resources
-    websites = db.query(models.Website).filter(models.Website.user_id == current_user.id).all()
-    redirects = db.query(models.Redirect).filter(models.Redirect.user_id == current_user.id).all()
-    github_mappings = db.query(models.GitHubMapping).filter(models.GitHubMapping.user_id == current_user.id).all()
+    for row in (await db.execute(_dashboard_query(current_user.id))).all():
+        if row.kind == "website":
+            websites.append({
+                "id": row.id,
+                "subdomain": row.name,
+                "created_at": row.created_at,
+                "updated_at": row.updated_at
+            })
+        elif row.kind == "redirect":
+            redirects.append({
+                "id": row.id,
+                "name": row.name,
+                "target_url": row.target,
+                "created_at": row.created_at,
+                "updated_at": row.updated_at
+            })
+        elif row.kind == "quota":
+            limits[row.name] = int(row.target)
+        else:
+            github_mappings.append({
+                "id": row.id,
+                "subdomain": row.name,
+                "github_username": row.target,
+                "repository_name": row.repository_name,
+                "created_at": row.created_at,
+                "updated_at": row.updated_at
+            })
     
-    return {
+    data = jsonable_encoder({
         "user": {
             "id": current_user.id,
             "username": current_user.username,
             "email": current_user.email,
         },
         "resource_counts": {
-            "websites": websites_count,
-            "redirects": redirects_count,
-            "github_mappings": github_mappings_count,
-            "max_allowed": 2
+            "websites": len(websites),
+            "redirects": len(redirects),
+            "github_mappings": len(github_mappings),
+            "max_allowed": quotas.QUOTA_DEFAULT_LIMIT,
+            "limits": limits
         },
         "websites": websites,
         "redirects": redirects,
         "github_mappings": github_mappings
-    }
\ No newline at end of file
+    })
+    
+    # Let the dashboard revalidate with If-None-Match instead of re-downloading
+    body = json.dumps(data, separators=(",", ":")).encode()
+    headers = {
+        "ETag": f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+        "Cache-Control": "private, no-cache"
+    }
+    
+    if if_none_match and etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -52,6 +52,39 @@ const apiRequest = async (url, method = 'GET', data = null) => {
     return result;
 };
 
+// Background jobs: DNS, extraction and cleanup finish after the request returns
+const JOB_POLL_INTERVAL_MS = 1500;
+
+const waitForJob = async (jobId) => {
+    while (true) {
+        const job = await apiRequest(`/jobs/${jobId}`);
+        if (!job || job.status === 'succeeded') {
+            return job;
+        }
+        if (job.status === 'failed') {
+            throw new Error(job.last_error || 'Background job failed');
+        }
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+};
+
+// Poll a job started by a request and refresh the dashboard when it settles
+const trackJob = (result, label) => {
+    if (!result || !result.job_id) {
+        return;
+    }
+    waitForJob(result.job_id)
+        .then(() => loadDashboardData())
+        .catch(async error => {
+            console.error(`${label} job failed:`, error);
+            loadDashboardData();
+            if (confirm(`${label} failed: ${error.message}\n\nRetry now?`)) {
+                await apiRequest(`/jobs/${result.job_id}/retry`, 'POST');
+                trackJob(result, label);
+            }
+        });
+};
+
 // Date formatting helper
 const formatDate = (dateString) => {
     const date = new Date(dateString);
@@ -73,10 +106,48 @@ document.getElementById('logout-link').addEventListener('click', (e) => {
     window.location.href = '/login';
 });
 
+// Last dashboard payload and its ETag, so reloads can revalidate with If-None-Match
+let dashboardCache = { etag: null, data: null };
+
+const fetchDashboardData = async () => {
+    const headers = {
+        'Authorization': `Bearer ${getAuthToken()}`
+    };
+
+    if (dashboardCache.etag) {
+        headers['If-None-Match'] = dashboardCache.etag;
+    }
+
+    const response = await fetch('/dashboard', { headers });
+
+    if (response.status === 401) {
+        localStorage.removeItem('access_token');
+        window.location.href = '/login';
+        return null;
+    }
+
+    // Nothing changed since the last load
+    if (response.status === 304) {
+        return dashboardCache.data;
+    }
+
+    const result = await response.json();
+
+    if (!response.ok) {
+        throw new Error(result.detail || 'API request failed');
+    }
+
+    dashboardCache = { etag: response.headers.get('ETag'), data: result };
+    return result;
+};
+
 // Load dashboard data
 const loadDashboardData = async () => {
     try {
-        const data = await apiRequest('/dashboard');
+        const data = await fetchDashboardData();
+        if (!data) {
+            return;
+        }
         
         // Update resource counts
         document.getElementById('websites-count').textContent = data.resource_counts.websites;
@@ -84,14 +155,15 @@ const loadDashboardData = async () => {
         document.getElementById('github-mappings-count').textContent = data.resource_counts.github_mappings;
         
         // Show/hide limit warnings
-        document.getElementById('website-limit-reached').classList.toggle('d-none', data.resource_counts.websites < data.resource_counts.max_allowed);
-        document.getElementById('add-website-btn').classList.toggle('d-none', data.resource_counts.websites >= data.resource_counts.max_allowed);
+        const limits = data.resource_counts.limits;
+        document.getElementById('website-limit-reached').classList.toggle('d-none', data.resource_counts.websites < limits.websites);
+        document.getElementById('add-website-btn').classList.toggle('d-none', data.resource_counts.websites >= limits.websites);
         
-        document.getElementById('redirect-limit-reached').classList.toggle('d-none', data.resource_counts.redirects < data.resource_counts.max_allowed);
-        document.getElementById('add-redirect-btn').classList.toggle('d-none', data.resource_counts.redirects >= data.resource_counts.max_allowed);
+        document.getElementById('redirect-limit-reached').classList.toggle('d-none', data.resource_counts.redirects < limits.redirects);
+        document.getElementById('add-redirect-btn').classList.toggle('d-none', data.resource_counts.redirects >= limits.redirects);
         
-        document.getElementById('github-mapping-limit-reached').classList.toggle('d-none', data.resource_counts.github_mappings < data.resource_counts.max_allowed);
-        document.getElementById('add-github-mapping-btn').classList.toggle('d-none', data.resource_counts.github_mappings >= data.resource_counts.max_allowed);
+        document.getElementById('github-mapping-limit-reached').classList.toggle('d-none', data.resource_counts.github_mappings < limits.github_mappings);
+        document.getElementById('add-github-mapping-btn').classList.toggle('d-none', data.resource_counts.github_mappings >= limits.github_mappings);
         
         // Populate websites table
         populateWebsitesTable(data.websites);
@@ -345,7 +417,8 @@ document.getElementById('website-submit-btn').addEventListener('click', async ()
         formData.append('zip_file', fileInput.files[0]);
         
         // Upload the website
-        await apiRequest('/upload', 'POST', formData);
+        const result = await apiRequest('/upload', 'POST', formData);
+        trackJob(result, 'Website setup');
         
         // Hide modal and reload dashboard
         websiteModal.hide();
@@ -385,7 +458,8 @@ document.getElementById('edit-website-submit-btn').addEventListener('click', asy
         submitBtn.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Updating...';
         
         // Update the website
-        await apiRequest(`/upload/${websiteId}?subdomain=${subdomain}`, 'PUT');
+        const result = await apiRequest(`/upload/${websiteId}?subdomain=${subdomain}`, 'PUT');
+        trackJob(result, 'Website DNS update');
         
         // Hide modal and reload dashboard
         editWebsiteModal.hide();
@@ -527,11 +601,12 @@ document.getElementById('github-mapping-submit-btn').addEventListener('click', a
         submitBtn.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Creating...';
         
         // Create the GitHub mapping
-        await apiRequest('/map-github', 'POST', {
+        const result = await apiRequest('/map-github', 'POST', {
             subdomain: subdomainInput.value,
             github_username: usernameInput.value,
             repository_name: repoInput.value
         });
+        trackJob(result, 'GitHub mapping DNS setup');
         
         // Hide modal and reload dashboard
         githubMappingModal.hide();
@@ -573,11 +648,12 @@ document.getElementById('edit-github-mapping-submit-btn').addEventListener('clic
         submitBtn.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Updating...';
         
         // Update the GitHub mapping
-        await apiRequest(`/map-github/${mappingId}`, 'PUT', {
+        const result = await apiRequest(`/map-github/${mappingId}`, 'PUT', {
             subdomain: subdomain,
             github_username: username,
             repository_name: repo
         });
+        trackJob(result, 'GitHub mapping DNS update');
         
         // Hide modal and reload dashboard
         editGithubMappingModal.hide();
@@ -621,7 +697,8 @@ document.getElementById('confirm-delete-btn').addEventListener('click', async ()
                 throw new Error('Unknown item type');
         }
         
-        await apiRequest(endpoint, 'DELETE');
+        const result = await apiRequest(endpoint, 'DELETE');
+        trackJob(result, 'Cleanup');
         
         // Hide modal and reload dashboard
         confirmDeleteModal.hide();
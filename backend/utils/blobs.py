@@ -0,0 +1,211 @@
+import os
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+
+from .compression import ENCODINGS, precompress_file
+from .routing import BASE_DIR
+
+# Content-addressed store of every hosted file: _blobs/<first 2 hex>/<sha256>,
+# with precompressed variants next to each blob (<sha256>.gz, <sha256>.br).
+# Deployments are trees of hard links into it, so a file shared by many
+# deployments is stored once.
+BLOBS_DIR = os.path.join(BASE_DIR, "static_sites", "_blobs")
+BLOBS_TMP_DIR = os.path.join(BLOBS_DIR, "_tmp")
+
+# Blobs no deployment links to are deleted once they have been unreferenced
+# for this many seconds, so a build that is about to link one keeps it. The
+# "collect_blobs" job sweeps the store this long after deployments are removed.
+BLOB_GC_GRACE = float(os.getenv("BLOB_GC_GRACE", "3600"))
+
+BLOB_CHUNK_SIZE = 1024 * 1024
+
+def blob_path(sha256, suffix=""):
+    """
+    Absolute path of a blob or one of its variants
+
+    Args:
+        sha256: Hex digest of the content
+        suffix: "" for the content itself, or a variant suffix such as ".gz"
+    """
+    return os.path.join(BLOBS_DIR, sha256[:2], sha256 + suffix)
+
+def _place(tmp_path, sha256):
+    """
+    Move a fully written temporary file into the store under its hash
+
+    Returns:
+        bool: False if the content was already stored; the file is removed
+    """
+    path = blob_path(sha256)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+        return False
+
+    # Blobs are shared by every deployment linking them and must never change
+    os.chmod(tmp_path, 0o444)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+    return True
+
+def temp_path():
+    """
+    Create an empty temporary file on the blob store's filesystem
+
+    Returns:
+        str: Its path, for writing content to be passed to adopt()
+    """
+    os.makedirs(BLOBS_TMP_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=BLOBS_TMP_DIR)
+    os.close(fd)
+    return path
+
+def store(source, max_size=None):
+    """
+    Copy a stream into the blob store, hashing it on the way
+
+    Args:
+        source: Binary file object
+        max_size: Stop and fail once the stream yields more bytes than this
+
+    Returns:
+        tuple: (sha256, size, created) where created is False if the content
+        was already stored
+
+    Raises:
+        ValueError: The stream is longer than max_size
+    """
+    digest = hashlib.sha256()
+    size = 0
+
+    tmp_path = temp_path()
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in iter(lambda: source.read(BLOB_CHUNK_SIZE), b""):
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise ValueError(f"Content is larger than the expected {max_size} bytes")
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    sha256 = digest.hexdigest()
+    return sha256, size, _place(tmp_path, sha256)
+
+def adopt(tmp_path, expected_sha256):
+    """
+    Move an uploaded file into the store after checking its hash
+
+    Args:
+        tmp_path: File created with temp_path(); it is consumed either way
+        expected_sha256: The hash the client claimed for it
+
+    Returns:
+        tuple: (size, created)
+
+    Raises:
+        ValueError: The content does not match the hash
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(tmp_path, "rb") as f:
+            for chunk in iter(lambda: f.read(BLOB_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        size = os.path.getsize(tmp_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    if digest.hexdigest() != expected_sha256:
+        os.remove(tmp_path)
+        raise ValueError("Content does not match its sha256")
+    return size, _place(tmp_path, expected_sha256)
+
+def exists(sha256):
+    return os.path.isfile(blob_path(sha256))
+
+def missing(hashes):
+    """
+    Hashes from a list that are not in the store
+
+    Returns:
+        list: Unique missing hashes, in their original order
+    """
+    return [sha256 for sha256 in dict.fromkeys(hashes) if not exists(sha256)]
+
+def ensure_variants(sha256):
+    """
+    Precompress a blob once; later deployments of the same content reuse the variants
+
+    Returns:
+        list: Encodings with a variant on disk
+    """
+    path = blob_path(sha256)
+    encodings = [encoding for encoding, suffix in ENCODINGS.items() if os.path.isfile(path + suffix)]
+    if encodings:
+        return encodings
+    return precompress_file(path)
+
+def link(sha256, target, suffix=""):
+    """
+    Place a blob (or variant) at a path inside a deployment
+
+    Hard-links where the filesystem allows it and copies otherwise.
+
+    Raises:
+        FileNotFoundError: The blob was garbage collected meanwhile; the
+            build should be retried
+    """
+    source = blob_path(sha256, suffix)
+    try:
+        os.link(source, target)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(source, target)
+
+def collect_garbage(grace=BLOB_GC_GRACE):
+    """
+    Delete blobs and variants that no deployment links to any more
+
+    A blob's only remaining link is its own name in the store, so a link
+    count of one marks it unreferenced; its ctime is when the last
+    deployment unlinked it.
+
+    Returns:
+        dict: Number of files and bytes removed, and of unreferenced files
+        kept because they were released less than grace seconds ago
+    """
+    removed = 0
+    freed = 0
+    pending = 0
+    cutoff = time.time() - grace
+
+    if not os.path.isdir(BLOBS_DIR):
+        return {"removed": 0, "bytes": 0, "pending": 0}
+
+    for root, _, names in os.walk(BLOBS_DIR):
+        in_tmp = root == BLOBS_TMP_DIR
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.lstat(path)
+                # Leftovers of interrupted writes are removed by age alone
+                if stat.st_nlink > 1 and not in_tmp:
+                    continue
+                if stat.st_ctime > cutoff:
+                    pending += 1
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += stat.st_size
+
+    if removed:
+        logging.info(f"Removed {removed} unreferenced blobs ({freed} bytes)")
+    return {"removed": removed, "bytes": freed, "pending": pending}
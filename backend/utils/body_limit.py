@@ -0,0 +1,50 @@
+from fastapi import HTTPException, status
+from starlette.responses import JSONResponse
+
+class BodySizeLimitMiddleware:
+    """
+    Reject request bodies larger than max_body_size while they stream in
+
+    Requests that declare a larger Content-Length are refused before any of
+    the body is read. Bodies without a usable Content-Length are counted as
+    they arrive, and reading stops with a 413 as soon as the limit is crossed,
+    so oversized uploads are never spooled in full.
+    """
+
+    def __init__(self, app, max_body_size):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > self.max_body_size:
+                    response = JSONResponse(
+                        {"detail": f"Request body exceeds the limit of {self.max_body_size // 1000000} MB"},
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                    )
+                    await response(scope, receive, send)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    # Raised inside the route while it parses the body, so the
+                    # normal HTTPException handling turns it into a 413
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Request body exceeds the limit of {self.max_body_size // 1000000} MB"
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -1,88 +1,405 @@
-import CloudFlare
 import os
-from dotenv import load_dotenv
+import time
+import asyncio
 import logging
+import httpx
+from dotenv import load_dotenv
 
 load_dotenv()
 
 # Cloudflare credentials from environment variables
 API_TOKEN = os.getenv("CLOUDFLARE_API_TOKEN")
+API_KEY = os.getenv("CLOUDFLARE_API_KEY")
 ZONE_ID = os.getenv("CLOUDFLARE_ZONE_ID")
 EMAIL = os.getenv("CLOUDFLARE_EMAIL")
 DOMAIN_NAME = os.getenv("DOMAIN_NAME", "sriox.com")
 
-# Initialize Cloudflare client
-cf = CloudFlare.CloudFlare(token=API_TOKEN, email=EMAIL)
+# Point this at a local fake server to test without touching Cloudflare
+API_BASE = os.getenv("CLOUDFLARE_API_BASE", "https://api.cloudflare.com/client/v4")
+
+# Connection pool size and maximum number of requests in flight at once
+CLOUDFLARE_MAX_CONNECTIONS = int(os.getenv("CLOUDFLARE_MAX_CONNECTIONS", "10"))
+CLOUDFLARE_MAX_CONCURRENCY = int(os.getenv("CLOUDFLARE_MAX_CONCURRENCY", "8"))
+
+# Retries for rate-limited (429) and 5xx responses
+CLOUDFLARE_MAX_RETRIES = int(os.getenv("CLOUDFLARE_MAX_RETRIES", "3"))
+CLOUDFLARE_TIMEOUT = float(os.getenv("CLOUDFLARE_TIMEOUT", "15"))
+
+# Zone-wide record cache: page size of the bulk listing, and seconds before a
+# lookup resyncs it
+CLOUDFLARE_PAGE_SIZE = int(os.getenv("CLOUDFLARE_PAGE_SIZE", "1000"))
+CLOUDFLARE_RECORD_CACHE_TTL = float(os.getenv("CLOUDFLARE_RECORD_CACHE_TTL", "300"))
+
+# Cloudflare's error code for a record id that does not exist
+RECORD_NOT_FOUND_CODE = 81044
+
+class CloudflareError(Exception):
+    """An API call that Cloudflare answered with success=false"""
 
-def create_subdomain(subdomain, record_type="A", content="", proxied=True):
+    def __init__(self, message, status_code=None, codes=()):
+        super().__init__(message)
+        self.status_code = status_code
+        self.codes = tuple(codes)
+
+    @property
+    def not_found(self):
+        return self.status_code == 404 or RECORD_NOT_FOUND_CODE in self.codes
+
+_client = None
+_semaphore = None
+
+# Monotonic time before which no request may be sent, set from Retry-After
+_paused_until = 0.0
+
+def _auth_headers():
+    if API_TOKEN:
+        return {"Authorization": f"Bearer {API_TOKEN}"}
+    return {"X-Auth-Email": EMAIL or "", "X-Auth-Key": API_KEY or ""}
+
+def get_client():
+    """
+    Get the shared HTTP client, creating it on first use
+
+    Returns:
+        httpx.AsyncClient: Client with a persistent keep-alive connection pool
+    """
+    global _client, _semaphore
+    if _client is None:
+        _semaphore = asyncio.Semaphore(CLOUDFLARE_MAX_CONCURRENCY)
+        _client = httpx.AsyncClient(
+            base_url=API_BASE,
+            headers=_auth_headers(),
+            timeout=CLOUDFLARE_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=CLOUDFLARE_MAX_CONNECTIONS,
+                max_keepalive_connections=CLOUDFLARE_MAX_CONNECTIONS
+            )
+        )
+    return _client
+
+async def close():
+    """Close the shared HTTP client and its connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _retry_after(response, attempt):
+    value = response.headers.get("Retry-After")
+    if value and value.isdigit():
+        return float(value)
+    return min(2 ** attempt, 30)
+
+async def _send(method, path, **kwargs):
+    """
+    Send one API request, throttled and retried on rate limits
+
+    A 429 pauses every request from this process until its Retry-After has
+    passed, rather than letting concurrent callers keep hitting the limit.
+
+    Returns:
+        dict: The decoded API response
+    """
+    global _paused_until
+
+    client = get_client()
+    async with _semaphore:
+        for attempt in range(CLOUDFLARE_MAX_RETRIES + 1):
+            delay = _paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            response = await client.request(method, path, **kwargs)
+
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt == CLOUDFLARE_MAX_RETRIES:
+                    break
+                wait = _retry_after(response, attempt)
+                if response.status_code == 429:
+                    _paused_until = max(_paused_until, time.monotonic() + wait)
+                    logging.warning(f"Cloudflare rate limit hit, pausing for {wait}s")
+                else:
+                    await asyncio.sleep(wait)
+                continue
+
+            data = response.json()
+            if not data.get("success"):
+                errors = data.get("errors") or [{"message": f"HTTP {response.status_code}"}]
+                raise CloudflareError(
+                    "; ".join(str(error.get("message", error)) for error in errors),
+                    status_code=response.status_code,
+                    codes=[error.get("code") for error in errors if isinstance(error, dict)]
+                )
+            return data
+
+    raise CloudflareError(f"Cloudflare API unavailable (HTTP {response.status_code})", status_code=response.status_code)
+
+async def _request(method, path, **kwargs):
+    """
+    Send one API request
+
+    Returns:
+        dict: The decoded "result" of the API response
+    """
+    return (await _send(method, path, **kwargs)).get("result")
+
+def _record_data(subdomain, record_type, content, proxied):
+    return {
+        'name': subdomain,
+        'type': record_type,
+        'content': content,
+        'proxied': proxied
+    }
+
+def _fqdn(subdomain):
+    return f"{subdomain}.{DOMAIN_NAME}"
+
+class RecordCache:
+    """
+    Process-local copy of the zone's DNS records
+
+    Synced from Cloudflare in one paginated listing and kept current by the
+    create, update and delete calls made through this module. It lets
+    lookups by name and reconciliation run without one request per
+    subdomain; record ids stored on the database rows remain the primary
+    source for deletes and renames. Records created by other processes may
+    be missing, so a name it has no record for is looked up again.
+    """
+
+    def __init__(self, ttl=CLOUDFLARE_RECORD_CACHE_TTL):
+        self.ttl = ttl
+        self._records = {}
+        self._synced_at = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def fresh(self):
+        return self._synced_at is not None and time.monotonic() - self._synced_at < self.ttl
+
+    async def sync(self):
+        """
+        Replace the cache with a full listing of the zone
+
+        Returns:
+            int: Number of records loaded
+        """
+        async with self._lock:
+            records = {}
+            page = 1
+            while True:
+                data = await _send("GET", f"/zones/{ZONE_ID}/dns_records", params={'page': page, 'per_page': CLOUDFLARE_PAGE_SIZE})
+                for record in data.get("result") or []:
+                    records[record["id"]] = record
+
+                info = data.get("result_info") or {}
+                if page >= info.get("total_pages", 1):
+                    break
+                page += 1
+
+            self._records = records
+            self._synced_at = time.monotonic()
+            logging.info(f"Synced {len(records)} DNS records from Cloudflare")
+            return len(records)
+
+    def by_name(self, subdomain):
+        name = _fqdn(subdomain)
+        return [record for record in self._records.values() if record.get("name") == name]
+
+    def all(self):
+        return list(self._records.values())
+
+    def put(self, record):
+        if record and record.get("id"):
+            self._records[record["id"]] = record
+
+    def discard(self, record_id):
+        self._records.pop(record_id, None)
+
+    def stats(self):
+        return {
+            "records": len(self._records),
+            "fresh": self.fresh,
+            "synced_seconds_ago": round(time.monotonic() - self._synced_at, 1) if self._synced_at is not None else None
+        }
+
+record_cache = RecordCache()
+
+async def list_records(subdomain):
+    """
+    List the DNS records for one subdomain
+
+    Args:
+        subdomain: The subdomain (without the main domain)
+
+    Returns:
+        list: Record dicts as returned by Cloudflare
+    """
+    return await _request("GET", f"/zones/{ZONE_ID}/dns_records", params={'name': _fqdn(subdomain)})
+
+async def _find_records(subdomain):
+    # Prefer the synced cache. A miss only means no record existed when it
+    # was synced (another process may have created one since), so ask
+    # Cloudflare for this name before reporting that there is none.
+    if record_cache.fresh:
+        records = record_cache.by_name(subdomain)
+        if records:
+            return records
+    records = await list_records(subdomain) or []
+    for record in records:
+        record_cache.put(record)
+    return records
+
+async def create_subdomain(subdomain, record_type="A", content="", proxied=True):
     """
     Create a subdomain DNS record in Cloudflare
-    
+
     Args:
         subdomain: The subdomain to create (without the main domain)
         record_type: DNS record type (A, CNAME, etc.)
         content: The target IP or domain
         proxied: Whether to proxy through Cloudflare
-        
+
     Returns:
-        dict: The created record data or error info
+        dict: The created record data and its record_id, or error info
     """
     try:
-        record = {
-            'name': subdomain,
-            'type': record_type,
-            'content': content,
-            'proxied': proxied
-        }
-        
-        response = cf.zones.dns_records.post(ZONE_ID, data=record)
-        logging.info(f"Created {record_type} record for {subdomain}.{DOMAIN_NAME}")
-        return {"success": True, "record": response}
+        response = await _request("POST", f"/zones/{ZONE_ID}/dns_records", json=_record_data(subdomain, record_type, content, proxied))
+        record_cache.put(response)
+        logging.info(f"Created {record_type} record for {_fqdn(subdomain)}")
+        return {"success": True, "record": response, "record_id": response.get("id")}
     except Exception as e:
         logging.error(f"Failed to create DNS record: {str(e)}")
         return {"success": False, "error": str(e)}
 
-def create_github_pages_mapping(subdomain, github_username):
+async def delete_record(record_id):
     """
-    Create a CNAME record pointing to GitHub Pages
-    
+    Delete one DNS record by id
+
     Args:
-        subdomain: The subdomain to create
-        github_username: GitHub username for the Pages site
-        
+        record_id: Cloudflare record id
+
     Returns:
-        dict: The created record data or error info
+        dict: Success status; not_found is set if the record was already gone
     """
-    return create_subdomain(
-        subdomain=subdomain,
-        record_type="CNAME",
-        content=f"{github_username}.github.io",
-        proxied=True
-    )
+    try:
+        await _request("DELETE", f"/zones/{ZONE_ID}/dns_records/{record_id}")
+        record_cache.discard(record_id)
+        return {"success": True}
+    except CloudflareError as e:
+        if e.not_found:
+            record_cache.discard(record_id)
+            return {"success": False, "not_found": True, "error": "DNS record not found"}
+        logging.error(f"Failed to delete DNS record {record_id}: {str(e)}")
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        logging.error(f"Failed to delete DNS record {record_id}: {str(e)}")
+        return {"success": False, "error": str(e)}
 
-def delete_subdomain(subdomain):
+async def delete_subdomain(subdomain, record_id=None):
     """
     Delete a subdomain DNS record from Cloudflare
-    
+
+    With a known record id this is a single API call. Otherwise the records
+    are looked up by name first.
+
     Args:
         subdomain: The subdomain to delete (without the main domain)
-        
+        record_id: Stored Cloudflare record id, if known
+
     Returns:
         dict: Success status and info
     """
+    if record_id:
+        result = await delete_record(record_id)
+        if result["success"]:
+            logging.info(f"Deleted DNS record for {_fqdn(subdomain)}")
+        if not result.get("not_found"):
+            return result
+        # The stored id is stale; clean up any record still using the name
+
     try:
-        # List records to find the ID for the subdomain
-        dns_records = cf.zones.dns_records.get(ZONE_ID, params={'name': f"{subdomain}.{DOMAIN_NAME}"})
-        
+        dns_records = await _find_records(subdomain)
+
         if not dns_records:
-            return {"success": False, "error": "DNS record not found"}
-        
-        # Delete the record
-        for record in dns_records:
-            cf.zones.dns_records.delete(ZONE_ID, record['id'])
-            
-        logging.info(f"Deleted DNS record for {subdomain}.{DOMAIN_NAME}")
+            return {"success": False, "not_found": True, "error": "DNS record not found"}
+
+        # Delete all matching records concurrently
+        results = await asyncio.gather(*[delete_record(record["id"]) for record in dns_records])
+        failed = [r for r in results if not r["success"] and not r.get("not_found")]
+        if failed:
+            return failed[0]
+
+        logging.info(f"Deleted DNS record for {_fqdn(subdomain)}")
         return {"success": True}
     except Exception as e:
         logging.error(f"Failed to delete DNS record: {str(e)}")
-        return {"success": False, "error": str(e)}
\ No newline at end of file
+        return {"success": False, "error": str(e)}
+
+async def update_record(record_id, subdomain, record_type="A", content="", proxied=True):
+    """
+    Overwrite one DNS record by id
+
+    Returns:
+        dict: The updated record data, or error info with not_found set if
+        the record no longer exists
+    """
+    try:
+        response = await _request("PUT", f"/zones/{ZONE_ID}/dns_records/{record_id}", json=_record_data(subdomain, record_type, content, proxied))
+        record_cache.put(response)
+        return {"success": True, "record": response, "record_id": response.get("id")}
+    except CloudflareError as e:
+        if e.not_found:
+            record_cache.discard(record_id)
+            return {"success": False, "not_found": True, "error": "DNS record not found"}
+        logging.error(f"Failed to update DNS record {record_id}: {str(e)}")
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        logging.error(f"Failed to update DNS record {record_id}: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+async def rename_subdomain(old_subdomain, subdomain, record_type="A", content="", proxied=True, record_id=None):
+    """
+    Point an existing record at a new name and/or target
+
+    The old record is updated in place instead of being deleted and
+    recreated. With a known record id this is a single API call; otherwise
+    the record is looked up by its old name first.
+
+    Args:
+        old_subdomain: The current subdomain
+        subdomain: The new subdomain (may equal old_subdomain)
+        record_type: DNS record type for the new record
+        content: The new target IP or domain
+        proxied: Whether to proxy through Cloudflare
+        record_id: Stored Cloudflare record id, if known
+
+    Returns:
+        dict: The updated record data and its record_id, or error info
+    """
+    if record_id:
+        result = await update_record(record_id, subdomain, record_type, content, proxied)
+        if result["success"]:
+            logging.info(f"Renamed DNS record {_fqdn(old_subdomain)} to {_fqdn(subdomain)}")
+        if not result.get("not_found"):
+            return result
+        # The stored id is stale; fall back to a lookup by name
+
+    try:
+        dns_records = await _find_records(old_subdomain)
+        if not dns_records:
+            return await create_subdomain(subdomain, record_type, content, proxied)
+
+        record, extra = dns_records[0], dns_records[1:]
+        results = await asyncio.gather(
+            update_record(record["id"], subdomain, record_type, content, proxied),
+            *[delete_record(r["id"]) for r in extra]
+        )
+
+        if results[0].get("not_found"):
+            return await create_subdomain(subdomain, record_type, content, proxied)
+        if results[0]["success"]:
+            logging.info(f"Renamed DNS record {_fqdn(old_subdomain)} to {_fqdn(subdomain)}")
+        return results[0]
+    except Exception as e:
+        logging.error(f"Failed to rename DNS record: {str(e)}")
+        return {"success": False, "error": str(e)}
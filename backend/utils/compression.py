@@ -0,0 +1,166 @@
+import os
+import gzip
+import tempfile
+import mimetypes
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only gzip variants are made
+    brotli = None
+
+# Files smaller than this are not worth compressing
+PRECOMPRESS_MIN_SIZE = int(os.getenv("PRECOMPRESS_MIN_SIZE", "256"))
+
+# A variant is kept only if it is at most this fraction of the original size
+PRECOMPRESS_MAX_RATIO = float(os.getenv("PRECOMPRESS_MAX_RATIO", "0.9"))
+
+# Files above PRECOMPRESS_FAST_SIZE are compressed at faster settings (brotli
+# at its highest quality manages well under 1 MB/s); files above
+# PRECOMPRESS_MAX_SIZE are not compressed at all
+PRECOMPRESS_FAST_SIZE = int(os.getenv("PRECOMPRESS_FAST_SIZE", str(1024 * 1024)))
+PRECOMPRESS_MAX_SIZE = int(os.getenv("PRECOMPRESS_MAX_SIZE", str(32 * 1024 * 1024)))
+
+# (brotli quality, gzip level) for files up to and above PRECOMPRESS_FAST_SIZE
+PRECOMPRESS_LEVELS = (11, 9)
+PRECOMPRESS_FAST_LEVELS = (5, 6)
+
+PRECOMPRESS_READ_SIZE = 1024 * 1024
+
+# Content types that compress well; images, fonts and archives are already compressed
+COMPRESSIBLE_TYPES = {
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/xml",
+    "application/wasm",
+    "image/svg+xml",
+    "image/x-icon",
+    "image/vnd.microsoft.icon",
+}
+
+# Content-Encoding -> file suffix, in order of preference when serving
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+VARIANT_SUFFIXES = tuple(ENCODINGS.values())
+
+def content_type(path):
+    """Guess a file's content type from its name"""
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+def is_compressible(path):
+    """
+    Check whether a file's content type is worth compressing
+
+    Args:
+        path: File path or name
+
+    Returns:
+        bool: True for text-like content
+    """
+    if path.endswith(VARIANT_SUFFIXES):
+        return False
+    media_type = content_type(path)
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+def _compress(source, target, encoding, levels):
+    """Compress one open file into another, a block at a time"""
+    brotli_quality, gzip_level = levels
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=brotli_quality)
+        for block in iter(lambda: source.read(PRECOMPRESS_READ_SIZE), b""):
+            target.write(compressor.process(block))
+        target.write(compressor.finish())
+        return
+    # An empty name and mtime=0 keep the output identical for identical input
+    with gzip.GzipFile(filename="", mode="wb", fileobj=target, compresslevel=gzip_level, mtime=0) as f:
+        for block in iter(lambda: source.read(PRECOMPRESS_READ_SIZE), b""):
+            f.write(block)
+
+def available_encodings():
+    """Encodings this server can produce variants for"""
+    return [encoding for encoding in ENCODINGS if encoding != "br" or brotli is not None]
+
+def precompress_file(path):
+    """
+    Write compressed siblings (path.br, path.gz) next to a file
+
+    Variants that do not save enough space are skipped, so the serving path
+    only finds variants worth sending. Each variant is streamed to a
+    temporary name and renamed into place, so it is never seen half-written.
+    Large files are compressed at faster settings, and the largest not at
+    all.
+
+    Args:
+        path: Absolute path of the file
+
+    Returns:
+        list: Encodings written
+    """
+    size = os.path.getsize(path)
+    if size > PRECOMPRESS_MAX_SIZE:
+        return []
+    levels = PRECOMPRESS_FAST_LEVELS if size > PRECOMPRESS_FAST_SIZE else PRECOMPRESS_LEVELS
+
+    written = []
+    for encoding in available_encodings():
+        variant_path = path + ENCODINGS[encoding]
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with open(path, "rb") as source, os.fdopen(fd, "wb") as target:
+                _compress(source, target, encoding, levels)
+            if os.path.getsize(tmp_path) <= size * PRECOMPRESS_MAX_RATIO:
+                os.chmod(tmp_path, 0o444)
+                os.replace(tmp_path, variant_path)
+                written.append(encoding)
+            elif os.path.exists(variant_path):
+                os.remove(variant_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return written
+
+def parse_accept_encoding(header):
+    """
+    Parse an Accept-Encoding header
+
+    Args:
+        header: Header value, possibly empty
+
+    Returns:
+        dict: Lower-cased coding -> quality
+    """
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+def choose_encoding(accept_encoding, available):
+    """
+    Pick the preferred encoding the client accepts
+
+    Args:
+        accept_encoding: The request's Accept-Encoding header
+        available: Encodings with a variant on disk
+
+    Returns:
+        str: "br", "gzip" or None for the identity encoding
+    """
+    accepted = parse_accept_encoding(accept_encoding)
+    for encoding in ENCODINGS:
+        if encoding not in available:
+            continue
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0:
+            return encoding
+    return None
@@ -0,0 +1,317 @@
+import os
+import re
+import shutil
+import secrets
+import logging
+import posixpath
+
+from sqlalchemy import func, or_, select, update
+
+from .. import models
+from ..db import SessionLocal
+from . import blobs, jobs, routing, serving
+from .compression import ENCODINGS, PRECOMPRESS_MIN_SIZE, VARIANT_SUFFIXES, is_compressible
+from .manifest import MANIFEST_NAME, load_manifest, manifest_entry, write_manifest
+from .workers import run_blocking
+
+# Built deployments kept per website for rollback, including the live one.
+# At least two are kept, so the deployment other workers may still route to
+# until their next routing table reload is not deleted.
+DEPLOYMENT_RETENTION = max(int(os.getenv("DEPLOYMENT_RETENTION", "5")), 2)
+
+# Largest deployment accepted, in files and in total bytes of content
+DEPLOYMENT_MAX_FILES = int(os.getenv("DEPLOYMENT_MAX_FILES", "10000"))
+DEPLOYMENT_MAX_SIZE = int(os.getenv("DEPLOYMENT_MAX_SIZE", str(200 * 1000000)))
+
+DEPLOYMENTS_DIR = os.path.join("static_sites", "_deployments")
+
+def website_deployments_path(website_id):
+    """
+    Folder holding the deployments of a website, relative to the backend package
+
+    Never removed as a whole: with SQLite reusing ids it can hold the
+    deployments of a later website too. The "_deployments" prefix cannot collide with the subdomain-named folders
+    of older uploads, as subdomains cannot contain underscores.
+    """
+    return os.path.join(DEPLOYMENTS_DIR, str(website_id))
+
+def deployment_folder_path(website_id, deployment_id):
+    """
+    Name the folder of a new immutable deployment, relative to the backend package
+
+    A random token follows the ids because SQLite reuses the ids of deleted
+    rows: a folder left behind by a deleted website whose cleanup has not
+    run yet must never pass for a build of a new website or deployment.
+    Always read the path back from the Deployment row.
+
+    Returns:
+        str: Path to store in Deployment.folder_path and, while the
+        deployment is live, Website.folder_path
+    """
+    return os.path.join(website_deployments_path(website_id), f"{deployment_id}-{secrets.token_hex(8)}")
+
+def is_deployment_folder(folder_path):
+    return bool(folder_path) and folder_path.startswith(DEPLOYMENTS_DIR + os.sep)
+
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+def normalize_path(file_name):
+    """
+    Normalize an uploaded file name to a relative posix path inside the site
+
+    Returns:
+        str: The path, or None for names that are not servable files
+
+    Raises:
+        ValueError: The name points outside the site
+    """
+    normalized = posixpath.normpath(file_name.replace("\\", "/"))
+    if posixpath.isabs(file_name) or normalized == ".." or normalized.startswith("../"):
+        raise ValueError(f"Security violation: Attempted path traversal with {file_name}")
+    if normalized == "." or normalized == MANIFEST_NAME:
+        return None
+    return normalized
+
+def drop_variants(files):
+    """
+    Remove uploaded .gz/.br files that sit next to the file they compress
+
+    Variants are generated from the files themselves, as they always were.
+
+    Args:
+        files: Relative path -> anything
+
+    Returns:
+        dict: The remaining entries
+    """
+    return {
+        relative: value for relative, value in files.items()
+        if not (relative.endswith(VARIANT_SUFFIXES) and os.path.splitext(relative)[0] in files)
+    }
+
+def _summary(manifest):
+    return {
+        "file_count": len(manifest["files"]),
+        "total_size": sum(entry["size"] for entry in manifest["files"].values())
+    }
+
+def assemble(folder_path, files):
+    """
+    Build a deployment folder out of blobs already in the store
+
+    Every file and its precompressed variants are hard-linked from the blob
+    store. The folder is assembled under a temporary name and renamed into
+    place, so it never exists half-built; calling this again for a folder
+    that exists does nothing.
+
+    Args:
+        folder_path: Deployment folder relative to the backend package
+        files: Relative posix path -> sha256
+
+    Returns:
+        dict: file_count and total_size
+
+    Raises:
+        FileNotFoundError: A blob is not in the store
+    """
+    extract_path = routing.site_folder(folder_path)
+    if os.path.isdir(extract_path):
+        return _summary(load_manifest(extract_path) or {"files": {}})
+
+    build_path = extract_path + ".building"
+    shutil.rmtree(build_path, ignore_errors=True)
+
+    try:
+        entries = {}
+        for relative, sha256 in files.items():
+            target = os.path.join(build_path, *relative.split("/"))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            blobs.link(sha256, target)
+
+            if is_compressible(relative) and os.path.getsize(target) >= PRECOMPRESS_MIN_SIZE:
+                for encoding in blobs.ensure_variants(sha256):
+                    blobs.link(sha256, target + ENCODINGS[encoding], ENCODINGS[encoding])
+
+            entries[relative] = manifest_entry(target, sha256)
+
+        # Record content hashes for ETags and the list of servable files
+        os.makedirs(build_path, exist_ok=True)
+        manifest = write_manifest(build_path, entries)
+        os.rename(build_path, extract_path)
+    except BaseException:
+        shutil.rmtree(build_path, ignore_errors=True)
+        raise
+
+    return _summary(manifest)
+
+def deployment_to_dict(deployment, live_id=None):
+    return {
+        "id": deployment.id,
+        "status": deployment.status,
+        "file_count": deployment.file_count,
+        "total_size": deployment.total_size,
+        "error": deployment.error,
+        "created_at": deployment.created_at,
+        "activated_at": deployment.activated_at,
+        "live": deployment.id == live_id
+    }
+
+async def create(db, website):
+    """
+    Add a deployment being built for a website to the session
+
+    Returns:
+        models.Deployment: The new deployment, with its id and folder assigned
+    """
+    deployment = models.Deployment(website_id=website.id, status="building")
+    db.add(deployment)
+    await db.flush()
+    deployment.folder_path = deployment_folder_path(website.id, deployment.id)
+    return deployment
+
+async def activate(db, website, deployment, only_if_newer=False):
+    """
+    Make a deployment the one a website serves
+
+    Going live is one UPDATE of the website row. The previous deployment's
+    files stay in place, so requests routed to it by workers that have not
+    reloaded their routing table yet are still answered. Call publish()
+    after committing.
+
+    Args:
+        db: AsyncSession
+        website: The Website
+        deployment: A built Deployment of that website
+        only_if_newer: Leave the website alone if it already serves a later
+            deployment, so a slow build never replaces a newer one
+
+    Returns:
+        bool: True if the deployment is now live
+    """
+    stmt = update(models.Website).where(models.Website.id == website.id)
+    if only_if_newer:
+        stmt = stmt.where(or_(
+            models.Website.deployment_id.is_(None),
+            models.Website.deployment_id <= deployment.id
+        ))
+
+    result = await db.execute(stmt.values(deployment_id=deployment.id, folder_path=deployment.folder_path))
+    if result.rowcount == 0:
+        return False
+
+    deployment.activated_at = func.now()
+    return True
+
+def publish(subdomain, folder_path, previous_folder_path=None):
+    """
+    Route a website to its new folder in this worker after activation
+
+    Args:
+        subdomain: The website's subdomain
+        folder_path: The live folder, relative to the backend package
+        previous_folder_path: The folder served before, if any
+    """
+    routing.sites.set(subdomain, routing.site_folder(folder_path))
+    if previous_folder_path and previous_folder_path != folder_path:
+        serving.invalidate_site(routing.site_folder(previous_folder_path))
+
+async def mark_failed(deployment_id, folder_path, error):
+    """Record that a build gave up, outside the caller's transaction"""
+    async with SessionLocal() as db:
+        await db.execute(
+            update(models.Deployment)
+            .where(
+                models.Deployment.id == deployment_id,
+                # SQLite reuses ids, so match the folder too
+                models.Deployment.folder_path == folder_path,
+                models.Deployment.status == "building"
+            )
+            .values(status="failed", error=error)
+        )
+        await db.commit()
+
+def remove_folders(folder_paths):
+    """
+    Delete deployment folders, and their website's deployments folder once empty
+
+    Args:
+        folder_paths: Deployment folders relative to the backend package
+    """
+    for folder_path in folder_paths:
+        shutil.rmtree(routing.site_folder(folder_path), ignore_errors=True)
+    for parent in {os.path.dirname(folder_path) for folder_path in folder_paths}:
+        try:
+            os.rmdir(routing.site_folder(parent))
+        except OSError:
+            # Still holds other deployments, or is already gone
+            pass
+
+async def schedule_garbage_collection(db):
+    """
+    Queue a sweep of the blob store for once blobs released now are past
+    BLOB_GC_GRACE
+
+    Walking the store costs time in proportion to every blob on the
+    platform, so it is not done on each deploy or delete; one queued sweep
+    covers all releases until it runs. Commit the session afterwards.
+    """
+    pending = await db.scalar(select(models.Job.id).where(
+        models.Job.kind == "collect_blobs",
+        models.Job.status == "pending"
+    ).limit(1))
+    if pending is None:
+        await jobs.enqueue(db, "collect_blobs", {}, delay=blobs.BLOB_GC_GRACE + 5)
+
+async def prune(website_id):
+    """
+    Delete a website's deployments beyond DEPLOYMENT_RETENTION and schedule
+    the removal of the blobs no deployment links to any more
+
+    Deployments still building and the live one are never deleted; the
+    rest are ranked by when they last went live, so the one just replaced
+    (which other workers may still route to) is kept.
+
+    Returns:
+        int: Number of deployments deleted
+    """
+    async with SessionLocal() as db:
+        website = await db.get(models.Website, website_id)
+        if website is None:
+            return 0
+
+        query = select(models.Deployment).where(
+            models.Deployment.website_id == website_id,
+            models.Deployment.status != "building"
+        )
+        if website.deployment_id is not None:
+            query = query.where(models.Deployment.id != website.deployment_id)
+
+        recent = func.coalesce(models.Deployment.activated_at, models.Deployment.created_at)
+        old = (await db.scalars(
+            query.order_by(recent.desc(), models.Deployment.id.desc()).offset(DEPLOYMENT_RETENTION - 1)
+        )).all()
+        if not old:
+            return 0
+
+        folder_paths = [deployment.folder_path for deployment in old]
+        for deployment in old:
+            await db.delete(deployment)
+        await schedule_garbage_collection(db)
+        await db.commit()
+
+    for folder_path in folder_paths:
+        serving.invalidate_site(routing.site_folder(folder_path))
+    await run_blocking(remove_folders, folder_paths)
+
+    logging.info(f"Pruned {len(folder_paths)} old deployments of website {website_id}")
+    return len(folder_paths)
+
+async def retire_folder(db, folder_path):
+    """
+    Queue the deletion of a pre-deployment website folder for once no
+    worker routes to it
+
+    The job waits out the routing table TTL, so other workers have switched
+    to the new deployment by the time it runs. Commit the session afterwards.
+    """
+    await jobs.enqueue(db, "retire_folder", {"folder_path": folder_path}, delay=routing.ROUTING_TABLE_TTL)
@@ -0,0 +1,95 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Total bytes of file bodies kept in memory per worker process
+HOT_CACHE_MAX_BYTES = int(os.getenv("HOT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Larger files are always streamed from disk
+HOT_CACHE_MAX_FILE_SIZE = int(os.getenv("HOT_CACHE_MAX_FILE_SIZE", str(256 * 1024)))
+
+class HotFileCache:
+    """
+    Byte-budgeted LRU cache of small file bodies
+
+    Entries are keyed by (site folder, path, encoding) so the precompressed
+    variants of a file are cached independently of it. When the budget is
+    exceeded the least recently used bodies are evicted.
+    """
+
+    def __init__(self, max_bytes=HOT_CACHE_MAX_BYTES, max_file_size=HOT_CACHE_MAX_FILE_SIZE):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self._entries = OrderedDict()
+        self._by_site = {}
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def cacheable(self, size):
+        return self.max_bytes > 0 and size <= self.max_file_size
+
+    def get(self, key):
+        """
+        Look up a body and mark it as recently used
+
+        Args:
+            key: (site folder, path, encoding)
+
+        Returns:
+            bytes: The cached body, or None
+        """
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        """Store a body, evicting the least recently used ones to stay in budget"""
+        if not self.cacheable(len(body)):
+            return
+
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = body
+            self._by_site.setdefault(key[0], set()).add(key)
+            self.size += len(body)
+
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self.evictions += 1
+
+    def _discard(self, key):
+        body = self._entries.pop(key, None)
+        if body is None:
+            return
+        self.size -= len(body)
+        keys = self._by_site.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_site[key[0]]
+
+    def invalidate_site(self, folder):
+        """Drop every cached body of one site"""
+        with self._lock:
+            for key in list(self._by_site.get(folder, ())):
+                self._discard(key)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "max_file_size": self.max_file_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
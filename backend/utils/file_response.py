@@ -0,0 +1,101 @@
+import os
+
+import anyio
+from starlette.responses import Response
+
+# Bytes read from the file, in a worker thread, per body message
+SITE_STREAM_CHUNK_SIZE = int(os.getenv("SITE_STREAM_CHUNK_SIZE", str(256 * 1024)))
+
+def parse_range(header, size):
+    """
+    Parse a Range header for a representation of a known size
+
+    Only single byte ranges are supported; anything else is ignored and
+    the full representation is sent, which RFC 9110 permits.
+
+    Args:
+        header: The Range header value
+        size: Size of the representation in bytes
+
+    Returns:
+        tuple: (start, end) inclusive, "unsatisfiable", or None to ignore
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if start >= size:
+                return "unsatisfiable"
+            if start > end:
+                return None
+        else:
+            # Suffix range: the final N bytes
+            length = int(last)
+            if length == 0:
+                return "unsatisfiable"
+            start, end = max(size - length, 0), size - 1
+    except ValueError:
+        return None
+
+    if start >= size:
+        return "unsatisfiable"
+    return start, min(end, size - 1)
+
+class FileRangeResponse(Response):
+    """
+    Send a whole file or one byte range of it without buffering it
+
+    Like Starlette's FileResponse, which has no Range support in the version
+    used here: the file is read in SITE_STREAM_CHUNK_SIZE chunks in worker
+    threads, so disk reads never block the event loop and no more than one
+    chunk per connection is held in memory.
+    """
+
+    def __init__(self, path, size, byte_range=None, headers=None, media_type=None):
+        self.path = path
+        self.size = size
+        self.start, self.end = byte_range or (0, size - 1)
+        status_code = 206 if byte_range else 200
+
+        super().__init__(content=None, status_code=status_code, headers=headers, media_type=media_type)
+
+        self.headers["content-length"] = str(self.end - self.start + 1)
+        if byte_range:
+            self.headers["content-range"] = f"bytes {self.start}-{self.end}/{size}"
+
+    async def __call__(self, scope, receive, send):
+        remaining = self.end - self.start + 1
+
+        try:
+            f = await anyio.open_file(self.path, "rb")
+        except FileNotFoundError:
+            # Removed since the manifest was loaded
+            await Response("File not found", status_code=404)(scope, receive, send)
+            return
+
+        async with f:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+            if remaining <= 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            else:
+                if self.start:
+                    await f.seek(self.start)
+                while remaining > 0:
+                    chunk = await f.read(min(SITE_STREAM_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        # Stored files never change, so this is a damaged store
+                        raise RuntimeError(f"{self.path} is shorter than its recorded size")
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,304 @@
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select, update
+
+from .. import models
+from ..db import SessionLocal
+
+# Jobs processed concurrently by each worker process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+# Seconds an idle worker sleeps before polling the job table again
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+
+# Attempts before a job is marked failed, and the retry backoff in seconds
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "5"))
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "300"))
+
+# Running jobs whose lock is older than this are assumed orphaned by a dead
+# worker and become claimable again. A live worker renews the lock of the job
+# it runs several times per timeout, so long builds are never claimed twice.
+JOB_LOCK_TIMEOUT = float(os.getenv("JOB_LOCK_TIMEOUT", "600"))
+JOB_HEARTBEAT_INTERVAL = JOB_LOCK_TIMEOUT / 4
+
+# Seconds a worker pauses after an unexpected error in its loop
+JOB_ERROR_BACKOFF = 1.0
+
+class PermanentError(Exception):
+    """Raised by a handler when retrying cannot help; the job fails at once"""
+
+# Job kind -> async handler(payload), and async on_failure(payload, error)
+HANDLERS = {}
+FAILURE_HANDLERS = {}
+
+_wakeup = None
+_tasks = []
+_running = set()
+
+def handler(kind, on_failure=None):
+    """
+    Register an async job handler
+
+    The handler receives the job payload as a dict. It may update the dict to
+    record completed steps; the payload is saved after every attempt, so a
+    retry resumes after the last completed step. Raising marks the attempt
+    as failed.
+
+    Args:
+        kind: Job kind the handler processes
+        on_failure: Async callable(payload, error) run once the job has
+            failed for good, to release what it held for a retry
+    """
+    def decorator(func):
+        HANDLERS[kind] = func
+        if on_failure is not None:
+            FAILURE_HANDLERS[kind] = on_failure
+        return func
+    return decorator
+
+async def enqueue(db, kind, payload, user_id=None, delay=0):
+    """
+    Add a job to the session
+
+    The job is committed together with the caller's own changes, so work is
+    only scheduled if the request's transaction succeeds. Call notify() after
+    committing to start it without waiting for the next poll.
+
+    Args:
+        db: The caller's AsyncSession
+        kind: Registered job kind
+        payload: JSON-serializable dict
+        user_id: Owner of the job, if any
+        delay: Seconds to wait before the job may run
+
+    Returns:
+        models.Job: The new job, with its id assigned
+    """
+    job = models.Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        status="pending",
+        attempts=0,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        run_after=datetime.utcnow() + timedelta(seconds=delay),
+        user_id=user_id
+    )
+    db.add(job)
+    await db.flush()
+    return job
+
+def notify():
+    """Wake an idle worker in this process"""
+    if _wakeup is not None:
+        _wakeup.set()
+
+def job_to_dict(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "last_error": job.last_error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at
+    }
+
+def retry_delay(attempts):
+    """
+    Exponential backoff before the next attempt
+
+    Args:
+        attempts: Attempts made so far (1 after the first failure)
+
+    Returns:
+        float: Delay in seconds
+    """
+    return min(JOB_RETRY_BASE_DELAY * (2 ** (attempts - 1)), JOB_RETRY_MAX_DELAY)
+
+def _claimable(now):
+    return or_(
+        and_(models.Job.status == "pending", models.Job.run_after <= now),
+        and_(models.Job.status == "running", models.Job.locked_at < now - timedelta(seconds=JOB_LOCK_TIMEOUT))
+    )
+
+async def _claim_next():
+    """
+    Atomically move the oldest due job to running
+
+    The conditional UPDATE makes the claim safe across worker processes:
+    only one of them can flip a given row.
+
+    Returns:
+        tuple: (job_id, kind, payload dict, attempt) or None if nothing is
+        due; attempt identifies this claim, as a reclaim increments it
+    """
+    async with SessionLocal() as db:
+        while True:
+            now = datetime.utcnow()
+            job_id = await db.scalar(
+                select(models.Job.id).where(_claimable(now)).order_by(models.Job.id).limit(1)
+            )
+            if job_id is None:
+                return None
+
+            result = await db.execute(
+                update(models.Job)
+                .where(models.Job.id == job_id, _claimable(now))
+                .values(status="running", locked_at=now, attempts=models.Job.attempts + 1)
+            )
+            await db.commit()
+
+            if result.rowcount == 1:
+                job = await db.get(models.Job, job_id)
+                return job.id, job.kind, json.loads(job.payload or "{}"), job.attempts
+            # Another worker claimed it first; look for the next one
+
+def _owned(job_id, attempt):
+    # Still running under this claim; a worker that reclaimed the job as
+    # orphaned has incremented attempts
+    return and_(models.Job.id == job_id, models.Job.status == "running", models.Job.attempts == attempt)
+
+async def _heartbeat(job_id, attempt):
+    """Renew a running job's lock until cancelled"""
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        try:
+            async with SessionLocal() as db:
+                await db.execute(
+                    update(models.Job).where(_owned(job_id, attempt)).values(locked_at=datetime.utcnow())
+                )
+                await db.commit()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Failed to renew the lock of job {job_id}: {str(e)}")
+
+async def _finish(job_id, attempt, payload, error=None, permanent=False):
+    """
+    Record the outcome of a claimed job
+
+    Returns:
+        str: The job's new status, or None if the claim was lost
+    """
+    async with SessionLocal() as db:
+        job = await db.scalar(select(models.Job).where(_owned(job_id, attempt)))
+        if job is None:
+            # Deleted, or reclaimed after the lock expired; that run records the outcome
+            logging.warning(f"Job {job_id} is no longer held by this worker; its result is dropped")
+            return None
+
+        job.payload = json.dumps(payload)
+        job.locked_at = None
+
+        if error is None:
+            job.status = "succeeded"
+            job.last_error = None
+        elif permanent or job.attempts >= job.max_attempts:
+            job.status = "failed"
+            job.last_error = error
+        else:
+            job.status = "pending"
+            job.last_error = error
+            job.run_after = datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts))
+
+        await db.commit()
+        return job.status
+
+async def run_job(job_id, kind, payload, attempt):
+    """
+    Run one claimed job and record the outcome
+
+    Args:
+        job_id: Id of the claimed job
+        kind: Job kind
+        payload: Decoded payload
+        attempt: The job's attempt count as claimed
+    """
+    job_handler = HANDLERS.get(kind)
+    if job_handler is None:
+        await _finish(job_id, attempt, payload, error=f"Unknown job kind: {kind}")
+        return
+
+    # Left in _running if cancelled, so stop() can requeue it
+    _running.add(job_id)
+    heartbeat = asyncio.create_task(_heartbeat(job_id, attempt))
+    try:
+        await job_handler(payload)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logging.error(f"Job {job_id} ({kind}) failed: {str(e)}")
+        _running.discard(job_id)
+        status = await _finish(job_id, attempt, payload, error=str(e), permanent=isinstance(e, PermanentError))
+        if status == "failed" and kind in FAILURE_HANDLERS:
+            try:
+                await FAILURE_HANDLERS[kind](payload, str(e))
+            except Exception as cleanup_error:
+                logging.error(f"Cleanup after job {job_id} ({kind}) failed: {str(cleanup_error)}")
+    else:
+        logging.info(f"Job {job_id} ({kind}) succeeded")
+        _running.discard(job_id)
+        await _finish(job_id, attempt, payload)
+    finally:
+        heartbeat.cancel()
+
+async def _worker_loop():
+    while True:
+        try:
+            claimed = await _claim_next()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Failed to claim job: {str(e)}")
+            claimed = None
+
+        if claimed is None:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+            continue
+
+        try:
+            await run_job(*claimed)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Such as the database failing while the outcome is recorded; the
+            # job's lock expires and it is claimed again
+            logging.error(f"Job worker error while running job {claimed[0]}: {str(e)}")
+            _running.discard(claimed[0])
+            await asyncio.sleep(JOB_ERROR_BACKOFF)
+
+def start():
+    """Start the job workers for this process"""
+    global _wakeup
+    if _tasks:
+        return
+    _wakeup = asyncio.Event()
+    for _ in range(JOB_WORKERS):
+        _tasks.append(asyncio.create_task(_worker_loop()))
+
+async def stop():
+    """Cancel the job workers and hand interrupted jobs back to the queue"""
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+
+    if _running:
+        async with SessionLocal() as db:
+            await db.execute(
+                update(models.Job)
+                .where(models.Job.id.in_(_running), models.Job.status == "running")
+                .values(status="pending", locked_at=None, run_after=datetime.utcnow())
+            )
+            await db.commit()
+        _running.clear()
@@ -0,0 +1,181 @@
+import os
+import json
+import base64
+import binascii
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, Query, status
+from sqlalchemy import DateTime, and_, func, literal, or_, select
+
+# Page size for resource listings when the client does not ask for one, and
+# the largest page a client may ask for
+LIST_DEFAULT_LIMIT = int(os.getenv("LIST_DEFAULT_LIMIT", "50"))
+LIST_MAX_LIMIT = int(os.getenv("LIST_MAX_LIMIT", "200"))
+
+class ListQuery:
+    """Query parameters shared by the resource listing endpoints"""
+
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+        limit: int = Query(LIST_DEFAULT_LIMIT, ge=1, le=LIST_MAX_LIMIT),
+        sort: str = Query("id", description="Sort field, prefixed with - for descending order"),
+        fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+        q: Optional[str] = Query(None, description="Only items whose name contains this text"),
+        created_after: Optional[datetime] = Query(None),
+        created_before: Optional[datetime] = Query(None)
+    ):
+        self.cursor = cursor
+        self.limit = limit
+        self.sort = sort
+        self.fields = fields
+        self.q = q
+        self.created_after = created_after
+        self.created_before = created_before
+
+def _bad_request(detail):
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+def encode_cursor(sort, value, row_id):
+    """
+    Opaque cursor pointing just after a row
+
+    Args:
+        sort: The sort parameter the page was produced with
+        value: The row's sort value
+        row_id: The row's id, which breaks ties
+
+    Returns:
+        str: URL-safe cursor
+    """
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor, sort, column):
+    """
+    Decode a cursor made by encode_cursor for the same sort
+
+    Returns:
+        tuple: (sort value, row id)
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, value, row_id = json.loads(raw)
+        if isinstance(column.type, DateTime) and value is not None:
+            value = datetime.fromisoformat(value)
+    except (binascii.Error, ValueError, TypeError):
+        raise _bad_request("Invalid cursor")
+
+    if cursor_sort != sort:
+        raise _bad_request("Cursor was created with a different sort")
+    return value, row_id
+
+def parse_fields(fields, available, computed=None):
+    """
+    Resolve the fields parameter to column names
+
+    Args:
+        fields: Comma-separated field names, or None for all fields
+        available: Column fields that can be selected
+        computed: Derived field -> (column fields it needs, function of the row)
+
+    Returns:
+        tuple: (requested fields, column fields to select)
+    """
+    computed = computed or {}
+    if not fields:
+        requested = list(available) + list(computed)
+    else:
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in requested if field not in available and field not in computed]
+        if unknown:
+            raise _bad_request(f"Unknown fields: {', '.join(unknown)}")
+
+    selected = {"id"}
+    for field in requested:
+        selected.update(computed[field][0] if field in computed else [field])
+    return requested, [field for field in available if field in selected]
+
+async def list_page(db, model, params, columns, sortable, name_column, filters=(), computed=None):
+    """
+    Fetch one keyset-paginated page of a user's resources
+
+    Pages are anchored on the last row's (sort value, id) instead of an
+    offset, so every page costs the same however deep the client goes.
+
+    Args:
+        db: AsyncSession
+        model: The mapped class being listed
+        params: ListQuery
+        columns: Field name -> column, in output order
+        sortable: Field names that may be sorted on
+        name_column: Column searched by the q parameter
+        filters: Extra WHERE clauses, e.g. the owner check
+        computed: Derived field -> (column fields it needs, function of the row)
+
+    Returns:
+        tuple: (list of dicts holding exactly the requested fields, next
+        cursor or None)
+    """
+    computed = computed or {}
+    descending = params.sort.startswith("-")
+    sort_field = params.sort.lstrip("-")
+    if sort_field not in sortable:
+        raise _bad_request(f"Cannot sort by {sort_field}; use one of: {', '.join(sortable)}")
+
+    requested, selected = parse_fields(params.fields, columns, computed)
+    sort_column = columns[sort_field]
+    id_column = model.id
+
+    # The sort value is needed to build the next cursor
+    query_columns = [columns[field].label(field) for field in selected]
+    if sort_field not in selected:
+        query_columns.append(sort_column.label("_sort"))
+
+    query = select(*query_columns).where(*filters)
+
+    if params.q:
+        escaped = params.q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.where(name_column.ilike(f"%{escaped}%", escape="\\"))
+    if params.created_after:
+        query = query.where(model.created_at >= params.created_after)
+    if params.created_before:
+        query = query.where(model.created_at < params.created_before)
+
+    if params.cursor:
+        value, row_id = decode_cursor(params.cursor, params.sort, sort_column)
+        # Compare against the anchor row's stored value so ties match exactly
+        # whatever the driver's datetime format; the cursor's copy is only
+        # used if that row has since been deleted
+        anchor = func.coalesce(
+            select(sort_column).where(id_column == row_id).scalar_subquery(),
+            literal(value, sort_column.type)
+        )
+        if descending:
+            after = or_(sort_column < anchor, and_(sort_column == anchor, id_column < row_id))
+        else:
+            after = or_(sort_column > anchor, and_(sort_column == anchor, id_column > row_id))
+        query = query.where(after)
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    rows = (await db.execute(query.limit(params.limit + 1))).mappings().all()
+
+    next_cursor = None
+    if len(rows) > params.limit:
+        rows = rows[:params.limit]
+        last = rows[-1]
+        sort_value = last[sort_field] if sort_field in selected else last["_sort"]
+        next_cursor = encode_cursor(params.sort, sort_value, last["id"])
+
+    items = [
+        {field: computed[field][1](row) if field in computed else row[field] for field in requested}
+        for row in rows
+    ]
+    return items, next_cursor
@@ -0,0 +1,117 @@
+import os
+import json
+import hashlib
+import logging
+
+from .compression import ENCODINGS, content_type
+
+# Written into each extracted website folder; never served
+MANIFEST_NAME = ".sriox-manifest.json"
+MANIFEST_VERSION = 1
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _is_variant(path):
+    # A .gz/.br file is a variant only if the file it compresses exists too
+    for suffix in ENCODINGS.values():
+        if path.endswith(suffix) and os.path.isfile(path[:-len(suffix)]):
+            return True
+    return False
+
+def build_manifest(folder):
+    """
+    Describe every servable file in an extracted website
+
+    Args:
+        folder: Absolute path of the website folder
+
+    Returns:
+        dict: {"version": ..., "files": {relative posix path: entry}} where an
+        entry has size, mtime, sha256, content_type and the precompressed
+        variants (encoding -> size)
+    """
+    files = {}
+    for root, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, folder).replace(os.sep, "/")
+            if relative == MANIFEST_NAME or _is_variant(path) or not os.path.isfile(path):
+                continue
+
+            files[relative] = manifest_entry(path, _sha256(path))
+
+    return {"version": MANIFEST_VERSION, "files": files}
+
+def manifest_entry(path, sha256):
+    """
+    Manifest entry for one file whose content hash is already known
+
+    Args:
+        path: Absolute path of the file; variants are looked up next to it
+        sha256: Hex digest of the file's content
+
+    Returns:
+        dict: size, mtime, sha256, content_type and variants
+    """
+    stat = os.stat(path)
+    variants = {}
+    for encoding, suffix in ENCODINGS.items():
+        if os.path.isfile(path + suffix):
+            variants[encoding] = os.path.getsize(path + suffix)
+
+    return {
+        "size": stat.st_size,
+        "mtime": int(stat.st_mtime),
+        "sha256": sha256,
+        "content_type": content_type(os.path.basename(path)),
+        "variants": variants
+    }
+
+def write_manifest(folder, files=None):
+    """
+    Save the manifest of a website folder
+
+    Args:
+        folder: Absolute path of the website folder
+        files: Entries already collected while writing the folder, keyed by
+            relative posix path; the folder is walked and hashed if omitted
+
+    Returns:
+        dict: The manifest written
+    """
+    manifest = build_manifest(folder) if files is None else {"version": MANIFEST_VERSION, "files": files}
+    tmp_path = os.path.join(folder, MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(tmp_path, os.path.join(folder, MANIFEST_NAME))
+    logging.info(f"Wrote manifest for {len(manifest['files'])} files in {folder}")
+    return manifest
+
+def load_manifest(folder):
+    """
+    Read a website folder's manifest
+
+    Args:
+        folder: Absolute path of the website folder
+
+    Returns:
+        dict: The manifest, or None for folders extracted before manifests
+        existed or with an unreadable manifest
+    """
+    try:
+        with open(os.path.join(folder, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable manifest in {folder}: {str(e)}")
+        return None
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
@@ -0,0 +1,54 @@
+import bisect
+import threading
+
+# Upper bounds of the latency buckets, in milliseconds
+DEFAULT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class Histogram:
+    """Fixed-bucket latency histogram that is cheap enough for hot paths"""
+
+    def __init__(self, buckets_ms=DEFAULT_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self._counts = [0] * (len(self.buckets_ms) + 1)
+        self._sum_ms = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """
+        Record one observation
+
+        Args:
+            seconds: Duration in seconds
+        """
+        ms = seconds * 1000.0
+        index = bisect.bisect_left(self.buckets_ms, ms)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum_ms += ms
+            self._count += 1
+
+    def snapshot(self):
+        """
+        Copy the current state
+
+        Returns:
+            dict: Count, sum and cumulative per-bucket counts keyed by "le" bound
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total_ms = self._sum_ms
+            count = self._count
+
+        buckets = {}
+        running = 0
+        for bound, bucket_count in zip(self.buckets_ms + ("+Inf",), counts):
+            running += bucket_count
+            buckets[str(bound)] = running
+
+        return {
+            "count": count,
+            "sum_ms": round(total_ms, 3),
+            "avg_ms": round(total_ms / count, 3) if count else 0.0,
+            "buckets_ms": buckets
+        }
@@ -0,0 +1,367 @@
+import os
+import logging
+
+from sqlalchemy import select, update
+
+from .. import models
+from ..db import SessionLocal
+from . import blobs, cloudflare, deployments, jobs, routing, serving, unzip
+from .jobs import PermanentError
+from .workers import run_blocking
+
+# Job handlers for DNS, extraction and cleanup work requested by the upload
+# and github routers. Each handler records finished steps in its payload so a
+# retry resumes where the previous attempt stopped.
+
+# Payload key -> model whose row owns the DNS record
+RECORD_OWNERS = {"website_id": models.Website, "mapping_id": models.GitHubMapping}
+
+def _record_owner(payload):
+    for key, model in RECORD_OWNERS.items():
+        if payload.get(key) is not None:
+            return model, payload[key]
+    return None, None
+
+async def _load_owner(payload):
+    model, row_id = _record_owner(payload)
+    if model is None:
+        return None
+    async with SessionLocal() as db:
+        return await db.get(model, row_id)
+
+async def _save_record_id(model, row_id, record_id):
+    if model is None or not record_id:
+        return
+    async with SessionLocal() as db:
+        # Keep updated_at for user-visible changes only
+        await db.execute(
+            update(model)
+            .where(model.id == row_id)
+            .values(dns_record_id=record_id, updated_at=model.updated_at)
+        )
+        await db.commit()
+
+def _website_target():
+    return "A", os.getenv("SERVER_IP", "127.0.0.1")
+
+def _mapping_target(mapping):
+    return "CNAME", f"{mapping.github_username}.github.io"
+
+async def _create_record(subdomain, record_type, content):
+    cf_result = await cloudflare.create_subdomain(subdomain, record_type, content)
+    if not cf_result["success"]:
+        raise RuntimeError(f"Failed to set up DNS: {cf_result['error']}")
+    return cf_result["record_id"]
+
+async def _delete_record(subdomain, record_id=None):
+    cf_result = await cloudflare.delete_subdomain(subdomain, record_id)
+    # A missing record means an earlier attempt already removed it
+    if not cf_result["success"] and not cf_result.get("not_found"):
+        raise RuntimeError(f"Failed to delete DNS: {cf_result['error']}")
+
+def _remove_zip(payload):
+    if payload.get("zip_path") and os.path.exists(payload["zip_path"]):
+        os.remove(payload["zip_path"])
+
+def _assemble_files(folder_path, files):
+    try:
+        return {"success": True, **deployments.assemble(folder_path, files)}
+    except FileNotFoundError:
+        return {"success": False, "error": "Some files are no longer stored; upload them again"}
+
+async def _deploy(payload):
+    """
+    Build the payload's deployment from its ZIP file or from a list of
+    stored blobs, make it live and prune deployments beyond the retention
+    limit
+
+    Returns:
+        bool: False if the website or deployment was deleted meanwhile
+    """
+    async with SessionLocal() as db:
+        deployment = await db.get(models.Deployment, payload["deployment_id"])
+
+    # SQLite reuses ids, so the row must also be the one this job built for
+    if deployment is None or deployment.folder_path != payload["folder_path"]:
+        logging.info(f"Deployment {payload['deployment_id']} was deleted before it went live")
+        _remove_zip(payload)
+        if payload.get("folder_path"):
+            await run_blocking(deployments.remove_folders, [payload["folder_path"]])
+        return False
+
+    if not payload.get("extracted"):
+        if "files" in payload:
+            extract_result = await run_blocking(_assemble_files, deployment.folder_path, payload["files"])
+        elif os.path.exists(payload["zip_path"]):
+            extract_result = await run_blocking(unzip.extract_deployment, payload["zip_path"], deployment.folder_path)
+        else:
+            extract_result = {"success": False, "error": "Uploaded ZIP file is no longer available"}
+        if not extract_result["success"]:
+            # The upload itself is unusable; other errors are retried
+            raise PermanentError(extract_result["error"])
+        payload["file_count"] = extract_result["file_count"]
+        payload["total_size"] = extract_result["total_size"]
+        payload["extracted"] = True
+
+    if not payload.get("activated"):
+        async with SessionLocal() as db:
+            deployment = await db.get(models.Deployment, payload["deployment_id"])
+            if deployment is not None and deployment.folder_path != payload["folder_path"]:
+                deployment = None
+            website = await db.get(models.Website, deployment.website_id) if deployment else None
+
+            if website is not None:
+                previous_folder_path = website.folder_path
+                deployment.status = "ready"
+                deployment.file_count = payload["file_count"]
+                deployment.total_size = payload["total_size"]
+                live = await deployments.activate(db, website, deployment, only_if_newer=True)
+                if live and previous_folder_path and not deployments.is_deployment_folder(previous_folder_path):
+                    # Uploaded before deployments existed; removed once unreferenced
+                    await deployments.retire_folder(db, previous_folder_path)
+                await db.commit()
+
+        if website is None:
+            logging.info(f"Deployment {payload['deployment_id']} was deleted while building")
+            if payload.get("folder_path"):
+                await run_blocking(deployments.remove_folders, [payload["folder_path"]])
+            return False
+
+        if live:
+            deployments.publish(website.subdomain, deployment.folder_path, previous_folder_path)
+        payload["activated"] = True
+
+    if not payload.get("pruned"):
+        await deployments.prune(deployment.website_id)
+        payload["pruned"] = True
+
+    return True
+
+async def _deploy_failed(payload, error):
+    """
+    Mark a deployment whose job gave up as failed and remove its ZIP file
+
+    Runs only once no retry is left, so every retry still finds the upload.
+    """
+    _remove_zip(payload)
+    if payload.get("deployment_id") is not None and not payload.get("activated"):
+        await deployments.mark_failed(payload["deployment_id"], payload["folder_path"], error)
+
+@jobs.handler("provision_website", on_failure=_deploy_failed)
+async def provision_website(payload):
+    """
+    Build a new website's first deployment and create its DNS record
+
+    Payload:
+        website_id, deployment_id, folder_path, zip_path
+    """
+    # Use the current row in case the website was renamed or deleted meanwhile
+    async with SessionLocal() as db:
+        website = await db.get(models.Website, payload["website_id"])
+
+        if website is not None and payload.get("deployment_id") is None:
+            # Queued before deployments existed
+            deployment = await deployments.create(db, website)
+            await db.commit()
+            payload["deployment_id"] = deployment.id
+            payload["folder_path"] = deployment.folder_path
+
+    if website is None:
+        logging.info(f"Website {payload['website_id']} was deleted before it was provisioned")
+        _remove_zip(payload)
+        return
+
+    if not await _deploy(payload):
+        return
+
+    if not payload.get("dns_created"):
+        record_type, content = _website_target()
+        record_id = await _create_record(website.subdomain, record_type, content)
+        await _save_record_id(models.Website, website.id, record_id)
+        payload["dns_created"] = True
+
+@jobs.handler("deploy_website", on_failure=_deploy_failed)
+async def deploy_website(payload):
+    """
+    Build a new deployment of an existing website and make it live
+
+    Payload:
+        deployment_id, folder_path, and either zip_path or files
+        (relative path -> sha256 of a stored blob)
+    """
+    await _deploy(payload)
+
+@jobs.handler("create_dns")
+async def create_dns(payload):
+    """
+    Create a single DNS record
+
+    Payload:
+        subdomain, record_type, content, mapping_id (optional)
+    """
+    subdomain, record_type, content = payload["subdomain"], payload["record_type"], payload["content"]
+
+    if payload.get("mapping_id") is not None:
+        # Use the current row in case the mapping was changed or deleted meanwhile
+        mapping = await _load_owner(payload)
+        if mapping is None:
+            logging.info(f"GitHub mapping {payload['mapping_id']} was deleted before its DNS was created")
+            return
+        subdomain = mapping.subdomain
+        record_type, content = _mapping_target(mapping)
+
+    record_id = await _create_record(subdomain, record_type, content)
+    await _save_record_id(*_record_owner(payload), record_id)
+
+@jobs.handler("rename_dns")
+async def rename_dns(payload):
+    """
+    Replace a DNS record with one for a new name or target
+
+    The record id stored on the owning row turns this into a single update
+    call; without one the record is looked up by its old name.
+
+    Payload:
+        old_subdomain, subdomain, record_type, content,
+        website_id or mapping_id (optional)
+    """
+    owner = await _load_owner(payload)
+    cf_result = await cloudflare.rename_subdomain(
+        payload["old_subdomain"], payload["subdomain"], payload["record_type"], payload["content"],
+        record_id=owner.dns_record_id if owner is not None else None
+    )
+    if not cf_result["success"]:
+        raise RuntimeError(f"Failed to update DNS: {cf_result['error']}")
+
+    if owner is not None and cf_result.get("record_id") != owner.dns_record_id:
+        await _save_record_id(type(owner), owner.id, cf_result.get("record_id"))
+
+@jobs.handler("delete_site")
+async def delete_site(payload):
+    """
+    Remove a subdomain's DNS record and, for hosted websites, its files
+
+    Payload:
+        subdomain, folder_path and deployment_folders (None and empty for
+        GitHub mappings), record_id (optional)
+    """
+    if not payload.get("dns_deleted"):
+        await _delete_record(payload["subdomain"], payload.get("record_id"))
+        payload["dns_deleted"] = True
+
+    if payload.get("folder_path"):
+        await run_blocking(unzip.delete_website_folder, payload["folder_path"])
+        serving.invalidate_site(routing.site_folder(payload["folder_path"]))
+
+    # Only the folders recorded at deletion: the website's id, and with it
+    # its deployments folder, may already belong to a new website
+    if payload.get("deployment_folders"):
+        await run_blocking(deployments.remove_folders, payload["deployment_folders"])
+        async with SessionLocal() as db:
+            await deployments.schedule_garbage_collection(db)
+            await db.commit()
+
+@jobs.handler("retire_folder")
+async def retire_folder(payload):
+    """
+    Delete a website folder from before deployments existed, replaced by a
+    deployment at least ROUTING_TABLE_TTL seconds ago
+
+    Payload:
+        folder_path
+    """
+    await run_blocking(unzip.delete_website_folder, payload["folder_path"])
+    serving.invalidate_site(routing.site_folder(payload["folder_path"]))
+
+@jobs.handler("collect_blobs")
+async def collect_blobs(payload):
+    """
+    Delete blobs that no deployment has linked to for BLOB_GC_GRACE seconds
+
+    Blobs released too recently are left for another sweep, queued here.
+
+    Payload:
+        none; removed, bytes and pending are recorded
+    """
+    payload.update(await run_blocking(blobs.collect_garbage))
+
+    if payload["pending"]:
+        async with SessionLocal() as db:
+            await deployments.schedule_garbage_collection(db)
+            await db.commit()
+
+async def reconcile_dns(repair=False):
+    """
+    Compare hosted websites and GitHub mappings with the zone's DNS records
+
+    The zone is fetched with one paginated listing rather than one request
+    per subdomain. Records that no row references are only reported, since
+    the zone may hold records managed outside this platform.
+
+    Args:
+        repair: Create missing records, correct wrong targets and store
+            record ids that are missing or stale
+
+    Returns:
+        dict: Counts and subdomains per category
+    """
+    await cloudflare.record_cache.sync()
+
+    async with SessionLocal() as db:
+        websites = (await db.scalars(select(models.Website))).all()
+        mappings = (await db.scalars(select(models.GitHubMapping))).all()
+
+    cached = {record["id"]: record for record in cloudflare.record_cache.all()}
+    report = {"ok": [], "missing": [], "wrong_target": [], "stale_id": [], "unreferenced": []}
+    referenced = set()
+
+    rows = [(website, _website_target()) for website in websites]
+    rows += [(mapping, _mapping_target(mapping)) for mapping in mappings]
+
+    for row, (record_type, content) in rows:
+        name = f"{row.subdomain}.{cloudflare.DOMAIN_NAME}"
+        record = cached.get(row.dns_record_id)
+        if record is None or record.get("name") != name:
+            matches = cloudflare.record_cache.by_name(row.subdomain)
+            record = matches[0] if matches else None
+
+        if record is None:
+            report["missing"].append(row.subdomain)
+            if repair:
+                cf_result = await cloudflare.create_subdomain(row.subdomain, record_type, content)
+                if cf_result["success"]:
+                    await _save_record_id(type(row), row.id, cf_result["record_id"])
+            continue
+
+        referenced.add(record["id"])
+
+        if record.get("type") != record_type or record.get("content") != content:
+            report["wrong_target"].append(row.subdomain)
+            if repair:
+                await cloudflare.update_record(record["id"], row.subdomain, record_type, content)
+        elif record["id"] == row.dns_record_id:
+            report["ok"].append(row.subdomain)
+
+        if record["id"] != row.dns_record_id:
+            report["stale_id"].append(row.subdomain)
+            if repair:
+                await _save_record_id(type(row), row.id, record["id"])
+
+    suffix = f".{cloudflare.DOMAIN_NAME}"
+    for record in cached.values():
+        if record["id"] not in referenced and record.get("name", "").endswith(suffix):
+            report["unreferenced"].append(record["name"][:-len(suffix)])
+
+    summary = {key: len(value) for key, value in report.items()}
+    logging.info(f"DNS reconciliation{' (repair)' if repair else ''}: {summary}")
+    return {"repaired": repair, "counts": summary, **report}
+
+@jobs.handler("reconcile_dns")
+async def reconcile_dns_job(payload):
+    """
+    Run a DNS reconciliation pass in the background
+
+    Payload:
+        repair (optional)
+    """
+    payload["counts"] = (await reconcile_dns(repair=payload.get("repair", False)))["counts"]
@@ -0,0 +1,133 @@
+import os
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .. import models
+
+# Resource name -> (model whose rows count against it, wording for errors)
+RESOURCES = {
+    "websites": (models.Website, "website uploads"),
+    "redirects": (models.Redirect, "redirects"),
+    "github_mappings": (models.GitHubMapping, "GitHub mappings")
+}
+
+# Limit for users without an explicit quota; QUOTA_LIMIT_WEBSITES,
+# QUOTA_LIMIT_REDIRECTS and QUOTA_LIMIT_GITHUB_MAPPINGS override it per resource
+QUOTA_DEFAULT_LIMIT = int(os.getenv("QUOTA_DEFAULT_LIMIT", "2"))
+DEFAULT_LIMITS = {
+    resource: int(os.getenv(f"QUOTA_LIMIT_{resource.upper()}", str(QUOTA_DEFAULT_LIMIT)))
+    for resource in RESOURCES
+}
+
+def _insert(db):
+    # Both supported databases have INSERT ... ON CONFLICT
+    dialect = db.get_bind().dialect.name
+    return postgresql.insert if dialect == "postgresql" else sqlite.insert
+
+def _where(user_id, resource):
+    return (models.Quota.user_id == user_id, models.Quota.resource == resource)
+
+def _current_usage(user_id, resource):
+    model = RESOURCES[resource][0]
+    return select(func.count(model.id)).where(model.user_id == user_id).scalar_subquery()
+
+async def _create_row(db, user_id, resource):
+    """
+    Create a user's quota row on first use, counting what they already own
+
+    Idempotent: does nothing if the row exists, including when a concurrent
+    transaction has just inserted it.
+
+    Returns:
+        bool: False if the row already existed
+    """
+    stmt = _insert(db)(models.Quota).values(
+        user_id=user_id,
+        resource=resource,
+        max_allowed=DEFAULT_LIMITS[resource],
+        used=_current_usage(user_id, resource)
+    ).on_conflict_do_nothing(index_elements=["user_id", "resource"])
+    return (await db.execute(stmt)).rowcount == 1
+
+async def _take(db, user_id, resource):
+    # The row lock taken here serializes concurrent creates by the same user
+    result = await db.execute(
+        update(models.Quota)
+        .where(*_where(user_id, resource), models.Quota.used < models.Quota.max_allowed)
+        .values(used=models.Quota.used + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+async def reserve(db, user_id, resource):
+    """
+    Count one new resource against a user's quota
+
+    Must run in the transaction that inserts the resource, so the usage
+    counter is committed or rolled back together with it. Normally a single
+    conditional UPDATE; the quota row is created the first time it is needed.
+
+    Args:
+        db: AsyncSession
+        user_id: The owner's id
+        resource: A key of RESOURCES
+
+    Raises:
+        HTTPException: 403 if the quota is used up
+    """
+    if await _take(db, user_id, resource):
+        return
+    # The row may be missing; whether this call or a concurrent one creates
+    # it, the retry below then sees it
+    await _create_row(db, user_id, resource)
+    if await _take(db, user_id, resource):
+        return
+
+    max_allowed = await db.scalar(select(models.Quota.max_allowed).where(*_where(user_id, resource)))
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail=f"You have reached the limit of {max_allowed} {RESOURCES[resource][1]}. Contact admin to add more."
+    )
+
+async def release(db, user_id, resource):
+    """
+    Give back one unit of a user's quota; call in the transaction that deletes the resource
+    """
+    await db.execute(
+        update(models.Quota)
+        .where(*_where(user_id, resource), models.Quota.used > 0)
+        .values(used=models.Quota.used - 1)
+        .execution_options(synchronize_session=False)
+    )
+
+async def set_limit(db, user_id, resource, max_allowed):
+    """
+    Change a user's limit for one resource
+
+    Lowering it below the current usage keeps existing resources but blocks
+    new ones until usage drops.
+    """
+    insert = _insert(db)(models.Quota).values(
+        user_id=user_id,
+        resource=resource,
+        max_allowed=max_allowed,
+        used=_current_usage(user_id, resource)
+    )
+    await db.execute(insert.on_conflict_do_update(
+        index_elements=["user_id", "resource"],
+        set_={"max_allowed": max_allowed, "updated_at": func.now()}
+    ))
+
+async def get_quotas(db, user_id):
+    """
+    A user's limit and usage for every resource
+
+    Returns:
+        dict: resource -> {"max_allowed": int, "used": int}
+    """
+    for resource in RESOURCES:
+        await _create_row(db, user_id, resource)
+    rows = (await db.scalars(select(models.Quota).where(models.Quota.user_id == user_id))).all()
+    return {row.resource: {"max_allowed": row.max_allowed, "used": row.used} for row in rows}
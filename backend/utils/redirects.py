@@ -0,0 +1,57 @@
+import os
+import html
+
+from fastapi.responses import Response
+
+DOMAIN_NAME = os.getenv("DOMAIN_NAME", "sriox.com")
+
+# 302 by default so browsers re-check short links whose target can change
+REDIRECT_STATUS_CODE = int(os.getenv("REDIRECT_STATUS_CODE", "302"))
+
+class CompiledRedirect:
+    """A redirect target together with its pre-rendered fallback page"""
+
+    __slots__ = ("target_url", "body")
+
+    def __init__(self, target_url):
+        self.target_url = target_url
+        self.body = render_redirect_page(target_url).encode("utf-8")
+
+    def response(self):
+        """
+        Build the HTTP redirect for this target
+
+        Returns:
+            Response: A 301/302 with Location set and the small HTML body
+        """
+        return Response(
+            content=self.body,
+            status_code=REDIRECT_STATUS_CODE,
+            headers={"Location": self.target_url},
+            media_type="text/html"
+        )
+
+def render_redirect_page(target_url):
+    """
+    Render the fallback page shown by clients that do not follow Location
+
+    Args:
+        target_url: The URL being redirected to
+
+    Returns:
+        str: HTML document
+    """
+    url = html.escape(target_url, quote=True)
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <meta http-equiv="refresh" content="0; url={url}">
+    <title>Redirecting to {url}</title>
+</head>
+<body>
+    <h1>Redirecting...</h1>
+    <p>You are being redirected to: <a href="{url}">{url}</a></p>
+    <p><small>Powered by <a href="https://{DOMAIN_NAME}">Sriox</a></small></p>
+</body>
+</html>"""
@@ -0,0 +1,119 @@
+import os
+import time
+import asyncio
+import logging
+
+from sqlalchemy import select
+
+from .. import models
+from ..db import SessionLocal
+from .redirects import CompiledRedirect
+
+# Seconds before a worker reloads its routing table from the database, so that
+# writes made by other workers converge without any cross-process signalling
+ROUTING_TABLE_TTL = float(os.getenv("ROUTING_TABLE_TTL", "30"))
+
+# Minimum seconds between reloads triggered by lookups for unknown names
+ROUTING_MISS_REFRESH = float(os.getenv("ROUTING_MISS_REFRESH", "5"))
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class RoutingTable:
+    """
+    Process-local name -> value table backed by the database
+
+    Lookups are plain dictionary hits. The table is reloaded in full when it is
+    older than the TTL, and write handlers in this process update it directly
+    so their changes are visible immediately.
+    """
+
+    def __init__(self, name, loader, ttl=ROUTING_TABLE_TTL, miss_refresh=ROUTING_MISS_REFRESH):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.miss_refresh = miss_refresh
+        self._entries = {}
+        self._loaded_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def reload(self):
+        """
+        Replace the table with a fresh snapshot from the database
+
+        Returns:
+            int: Number of entries loaded
+        """
+        loaded_at = self._loaded_at
+        async with self._lock:
+            # Another request already reloaded while this one was waiting
+            if self._loaded_at != loaded_at:
+                return len(self._entries)
+
+            try:
+                async with SessionLocal() as db:
+                    entries = await self.loader(db)
+            except Exception as e:
+                # Keep serving the previous snapshot and retry on the next lookup
+                logging.error(f"Failed to load {self.name} routing table: {str(e)}")
+                return len(self._entries)
+
+            self._entries = entries
+            self._loaded_at = time.monotonic()
+            return len(entries)
+
+    async def get(self, key):
+        """
+        Look up a name, reloading the table first if it has gone stale
+
+        Args:
+            key: The name to resolve
+
+        Returns:
+            The stored value, or None if the name is unknown
+        """
+        now = time.monotonic()
+        if now - self._loaded_at > self.ttl:
+            await self.reload()
+
+        value = self._entries.get(key)
+
+        # The name may have been created by another worker since the last load
+        if value is None and now - self._loaded_at > self.miss_refresh:
+            await self.reload()
+            value = self._entries.get(key)
+
+        return value
+
+    def set(self, key, value):
+        """Add or replace a single entry after a committed write"""
+        self._entries[key] = value
+
+    def remove(self, key):
+        """Drop a single entry after a committed delete or rename"""
+        self._entries.pop(key, None)
+
+def site_folder(folder_path):
+    """
+    Resolve a Website.folder_path to an absolute directory
+
+    Args:
+        folder_path: Path relative to the backend package
+
+    Returns:
+        str: Absolute folder path
+    """
+    return os.path.join(BASE_DIR, folder_path)
+
+async def _load_sites(db):
+    rows = (await db.execute(select(models.Website.subdomain, models.Website.folder_path))).all()
+    return {subdomain: site_folder(folder_path) for subdomain, folder_path in rows}
+
+# Subdomain -> absolute folder of the hosted website
+sites = RoutingTable("sites", _load_sites)
+
+async def _load_redirects(db):
+    rows = (await db.execute(select(models.Redirect.name, models.Redirect.target_url))).all()
+    return {name: CompiledRedirect(target_url) for name, target_url in rows}
+
+# Redirect name -> compiled redirect response
+redirects = RoutingTable("redirects", _load_redirects)
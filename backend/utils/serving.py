@@ -0,0 +1,415 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from urllib.parse import quote
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from . import compression
+from .file_cache import HotFileCache
+from .file_response import FileRangeResponse, parse_range
+from .manifest import MANIFEST_NAME, build_manifest, load_manifest
+from .routing import BASE_DIR
+from .workers import run_blocking
+
+# Cache-Control for HTML pages, for fingerprinted assets and for everything else
+SITE_CACHE_CONTROL_HTML = os.getenv("SITE_CACHE_CONTROL_HTML", "public, max-age=0, must-revalidate")
+SITE_CACHE_CONTROL_HASHED = os.getenv("SITE_CACHE_CONTROL_HASHED", "public, max-age=31536000, immutable")
+SITE_CACHE_CONTROL_DEFAULT = os.getenv("SITE_CACHE_CONTROL_DEFAULT", "public, max-age=3600")
+
+# File names carrying a content hash in a format bundlers emit, directly
+# before the extension:
+#   - lowercase hex of 8-64 characters after a dot (main.3f9a2c1d.js,
+#     app.12345678.js, 2.3f9a2c1d.chunk.js), or after a hyphen if it mixes letters and digits
+#     (index-3f9a2c1d.js, framework-2c79e2a64abdb08b.js)
+#   - 8 base64url or base32 characters after a hyphen with a letter and a
+#     digit (index-BfX3k9a2.js, chunk-5UAN2WZN.js), for scripts, styles,
+#     fonts and WebAssembly only, as they look like photo-DSC01234.jpg or
+#     report-Q3Final1.pdf
+# A missed hash only gets the shorter default lifetime, while a false match
+# would pin a file for a year.
+SITE_HASHED_ASSET_PATTERN = re.compile(os.getenv(
+    "SITE_HASHED_ASSET_PATTERN",
+    r"(?:\.[0-9a-f]{8,64}(?:\.chunk)?\.[A-Za-z0-9]+"
+    r"|-(?=[0-9a-f]*[a-f])(?=[0-9a-f]*\d)[0-9a-f]{8,64}\.[A-Za-z0-9]+"
+    r"|-(?=[A-Za-z0-9_-]{0,7}[A-Za-z])(?=[A-Za-z0-9_-]{0,7}\d)[A-Za-z0-9_-]{8}\.(?:m?js|css|woff2?|ttf|otf|wasm))$"
+))
+
+# Hand file sending off to nginx: responses carry X-Accel-Redirect pointing at
+# SITE_ACCEL_PREFIX + the file's path under static_sites, and nginx serves the
+# bytes from its internal location (see nginx.conf)
+SITE_ACCEL_REDIRECT = os.getenv("SITE_ACCEL_REDIRECT", "false").lower() in ("1", "true", "yes")
+SITE_ACCEL_PREFIX = "/" + os.getenv("SITE_ACCEL_PREFIX", "/_static_sites/").strip("/") + "/"
+
+STATIC_SITES_DIR = os.path.join(BASE_DIR, "static_sites")
+
+# Seconds before a cached site index checks whether its manifest was rewritten,
+# so extractions done by other worker processes are picked up
+SITE_INDEX_TTL = float(os.getenv("SITE_INDEX_TTL", "30"))
+
+# Files listed across all cached site indexes per worker process; the least
+# recently requested sites, such as replaced deployments, are dropped beyond it
+SITE_INDEX_MAX_FILES = int(os.getenv("SITE_INDEX_MAX_FILES", "200000"))
+
+def cache_control(path, media_type):
+    """
+    Pick the Cache-Control policy for a served file
+
+    Args:
+        path: Request path within the site
+        media_type: The file's content type
+
+    Returns:
+        str: Cache-Control header value
+    """
+    if media_type == "text/html":
+        return SITE_CACHE_CONTROL_HTML
+    if SITE_HASHED_ASSET_PATTERN.search(path.rsplit("/", 1)[-1]):
+        return SITE_CACHE_CONTROL_HASHED
+    return SITE_CACHE_CONTROL_DEFAULT
+
+def make_etag(sha256, encoding=None):
+    """
+    Strong ETag for one representation of a file
+
+    Each encoding is a different byte sequence, so it gets its own tag.
+    """
+    tag = sha256[:32]
+    return f'"{tag}-{encoding}"' if encoding else f'"{tag}"'
+
+def etag_matches(if_none_match, etag):
+    """
+    Check an If-None-Match header against the current ETag
+
+    Returns:
+        bool: True if the client's copy is current
+    """
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+def is_not_modified(request_headers, etag, mtime):
+    """
+    Evaluate If-None-Match / If-Modified-Since for a GET
+
+    If-Modified-Since is ignored when If-None-Match is present.
+
+    Args:
+        request_headers: The request's headers
+        etag: Current ETag of the representation
+        mtime: Current modification time (Unix seconds)
+
+    Returns:
+        bool: True if a 304 should be sent
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+
+    return False
+
+def if_range_matches(request_headers, etag, last_modified):
+    """
+    Check If-Range; a Range is only honoured if the representation is unchanged
+
+    Returns:
+        bool: True if there is no If-Range or it still matches
+    """
+    if_range = request_headers.get("if-range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        return if_range == etag
+    return if_range == last_modified
+
+def accel_redirect_path(file_path):
+    """
+    Internal nginx URI for a file under static_sites
+
+    Args:
+        file_path: Absolute path of the file
+
+    Returns:
+        str: SITE_ACCEL_PREFIX followed by the percent-encoded relative path
+    """
+    relative = os.path.relpath(file_path, STATIC_SITES_DIR).replace(os.sep, "/")
+    return SITE_ACCEL_PREFIX + quote(relative)
+
+def resolve_path(path):
+    """
+    Normalize a request path to a manifest key
+
+    Returns:
+        str: Relative posix path, "index.html" for the site root
+    """
+    path = path.strip("/")
+    return path or "index.html"
+
+class SiteFile:
+    """One servable file of a hosted website, with its response headers precomputed"""
+
+    __slots__ = ("path", "size", "mtime", "content_type", "sha256", "variants", "compressible", "headers")
+
+    def __init__(self, folder, relative, entry):
+        self.path = os.path.join(folder, *relative.split("/"))
+        self.size = entry["size"]
+        self.mtime = entry["mtime"]
+        self.content_type = entry["content_type"]
+        self.sha256 = entry["sha256"]
+        self.variants = entry["variants"]
+        self.compressible = compression.is_compressible(relative)
+
+        self.headers = {
+            "Accept-Ranges": "bytes",
+            "Cache-Control": cache_control(relative, self.content_type),
+            "Last-Modified": formatdate(self.mtime, usegmt=True)
+        }
+        if self.compressible:
+            self.headers["Vary"] = "Accept-Encoding"
+
+    def encoded_size(self, encoding):
+        return self.variants[encoding] if encoding else self.size
+
+class SiteManifest:
+    """In-memory manifest of one website folder: request path -> SiteFile"""
+
+    def __init__(self, folder, manifest, manifest_mtime):
+        self.folder = folder
+        self.manifest_mtime = manifest_mtime
+        self.loaded_at = time.monotonic()
+        self.files = {
+            relative: SiteFile(folder, relative, entry)
+            for relative, entry in manifest["files"].items()
+        }
+
+    def get(self, path):
+        return self.files.get(resolve_path(path))
+
+# Bodies of small, frequently served files and their compressed variants
+hot_files = HotFileCache()
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def _manifest_mtime(folder):
+    try:
+        return os.stat(os.path.join(folder, MANIFEST_NAME)).st_mtime_ns
+    except OSError:
+        return None
+
+def _load_site(folder):
+    """
+    Read a website folder's manifest into a SiteManifest
+
+    Folders extracted before manifests existed are indexed in memory by
+    walking them once.
+
+    Returns:
+        SiteManifest: The index, or None if the folder does not exist
+    """
+    if not os.path.isdir(folder):
+        return None
+
+    manifest_mtime = _manifest_mtime(folder)
+    manifest = load_manifest(folder) if manifest_mtime is not None else None
+    if manifest is None:
+        logging.info(f"No manifest in {folder}, indexing it in memory")
+        manifest = build_manifest(folder)
+    return SiteManifest(folder, manifest, manifest_mtime)
+
+class SiteIndex:
+    """
+    Process-local LRU cache of site manifests, keyed by absolute folder
+
+    A lookup is a dictionary hit; the disk is only touched to load a site the
+    first time it is requested and, at most once per TTL, to check whether
+    its manifest was rewritten. Once the cached manifests list more than
+    max_files files, the least recently used sites are evicted.
+    """
+
+    def __init__(self, ttl=SITE_INDEX_TTL, max_files=SITE_INDEX_MAX_FILES):
+        self.ttl = ttl
+        self.max_files = max_files
+        self._sites = OrderedDict()
+        self._locks = {}
+        self.files = 0
+        self.loads = 0
+        self.evictions = 0
+
+    async def get(self, folder):
+        """
+        Get the manifest of a website folder, loading it if needed
+
+        Args:
+            folder: Absolute path of the website folder
+
+        Returns:
+            SiteManifest: The index, or None if the folder does not exist
+        """
+        site = self._sites.get(folder)
+        if site is not None and time.monotonic() - site.loaded_at <= self.ttl:
+            self._sites.move_to_end(folder)
+            return site
+
+        lock = self._locks.setdefault(folder, asyncio.Lock())
+        async with lock:
+            site = self._sites.get(folder)
+            if site is not None and time.monotonic() - site.loaded_at <= self.ttl:
+                self._sites.move_to_end(folder)
+                return site
+
+            if site is not None:
+                # Manifest unchanged (or still absent): keep the index and restart its TTL
+                if await run_blocking(_manifest_mtime, folder) == site.manifest_mtime:
+                    site.loaded_at = time.monotonic()
+                    if folder in self._sites:
+                        self._sites.move_to_end(folder)
+                    return site
+
+            if site is not None:
+                # The site was re-extracted; cached bodies may be outdated
+                hot_files.invalidate_site(folder)
+
+            site = await run_blocking(_load_site, folder)
+            self.loads += 1
+            self._discard(folder)
+            if site is not None:
+                self._store(folder, site)
+
+        self._locks.pop(folder, None)
+        return site
+
+    def _store(self, folder, site):
+        self._sites[folder] = site
+        self.files += len(site.files)
+
+        # Always keep the site just loaded, even if it alone exceeds the budget
+        while self.files > self.max_files and len(self._sites) > 1:
+            oldest = next(iter(self._sites))
+            self._discard(oldest)
+            # Its bodies would be served unchecked if it is loaded again
+            hot_files.invalidate_site(oldest)
+            self.evictions += 1
+
+    def _discard(self, folder):
+        site = self._sites.pop(folder, None)
+        if site is not None:
+            self.files -= len(site.files)
+
+    def invalidate(self, folder):
+        """Forget a site after it was re-extracted or deleted"""
+        self._discard(folder)
+
+    def stats(self):
+        return {
+            "sites": len(self._sites),
+            "files": self.files,
+            "max_files": self.max_files,
+            "loads": self.loads,
+            "evictions": self.evictions
+        }
+
+# Absolute website folder -> SiteManifest
+site_index = SiteIndex()
+
+def invalidate_site(folder):
+    """
+    Forget everything cached about a site after it was re-uploaded, renamed
+    or deleted
+
+    Args:
+        folder: Absolute path of the website folder
+    """
+    site_index.invalidate(folder)
+    hot_files.invalidate_site(folder)
+
+async def serve_site_file(request, site_folder, path):
+    """
+    Build the response for one file of a hosted website
+
+    Only files listed in the site's manifest can be served, so unknown paths
+    404 without touching the disk and no path can escape the site folder.
+
+    Args:
+        request: The incoming request
+        site_folder: Absolute path of the website folder
+        path: Requested path within the site
+
+    Returns:
+        Response: The file, a precompressed variant of it, one byte range
+        of either (206), or a 304
+    """
+    site = await site_index.get(site_folder)
+    site_file = site.get(path) if site is not None else None
+
+    if site_file is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    headers = dict(site_file.headers)
+    encoding = None
+
+    if site_file.compressible:
+        # Send a precompressed variant written at extraction time if the client accepts one
+        encoding = compression.choose_encoding(request.headers.get("accept-encoding"), site_file.variants)
+
+    headers["ETag"] = make_etag(site_file.sha256, encoding)
+
+    if is_not_modified(request.headers, headers["ETag"], site_file.mtime):
+        return Response(status_code=304, headers=headers)
+
+    file_path = site_file.path
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        file_path += compression.ENCODINGS[encoding]
+
+    if SITE_ACCEL_REDIRECT:
+        # nginx sends the bytes and handles Range; headers set here are copied by its internal location
+        headers["X-Accel-Redirect"] = accel_redirect_path(file_path)
+        return Response(media_type=site_file.content_type, headers=headers)
+
+    size = site_file.encoded_size(encoding)
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header and if_range_matches(request.headers, headers["ETag"], headers["Last-Modified"]):
+        byte_range = parse_range(range_header, size)
+        if byte_range == "unsatisfiable":
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+
+    if hot_files.cacheable(size):
+        key = (site.folder, site_file.path, encoding)
+        body = hot_files.get(key)
+        if body is None:
+            try:
+                body = await run_blocking(_read_file, file_path)
+            except FileNotFoundError:
+                # Deleted by another worker since the manifest was loaded
+                invalidate_site(site.folder)
+                raise HTTPException(status_code=404, detail="File not found")
+            hot_files.put(key, body)
+
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return Response(body[start:end + 1], status_code=206, media_type=site_file.content_type, headers=headers)
+        return Response(body, media_type=site_file.content_type, headers=headers)
+
+    # Large files: streamed in chunks read off the event loop
+    return FileRangeResponse(file_path, size, byte_range, headers=headers, media_type=site_file.content_type)
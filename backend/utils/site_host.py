@@ -0,0 +1,94 @@
+import os
+
+from fastapi import HTTPException, status
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from . import routing, serving
+
+# Labels under DOMAIN_NAME that belong to the platform itself, never to a site
+SITE_HOST_RESERVED = {
+    label.strip().lower()
+    for label in os.getenv("SITE_HOST_RESERVED", "www").split(",")
+    if label.strip()
+}
+
+def site_subdomain(scope, domain_name):
+    """
+    Extract the hosted-site subdomain a request is addressed to
+
+    Only the Host header is used. nginx passes the client's Host through
+    unchanged, while X-Forwarded-Host can be supplied by the client itself
+    and would let a request to the platform origin be answered with a
+    hosted site's files.
+
+    Args:
+        scope: ASGI HTTP scope
+        domain_name: The platform's main domain
+
+    Returns:
+        str: The subdomain, or None for requests to the platform itself
+    """
+    host = None
+    for name, value in scope["headers"]:
+        if name == b"host":
+            host = value
+            break
+    if not host:
+        return None
+
+    # Without port or trailing dot
+    host = host.decode("latin-1").strip().lower()
+    host = host.rsplit(":", 1)[0] if not host.endswith("]") else host
+    host = host.rstrip(".")
+
+    suffix = "." + domain_name
+    if not host.endswith(suffix):
+        return None
+
+    subdomain = host[:-len(suffix)]
+    if not subdomain or "." in subdomain or subdomain in SITE_HOST_RESERVED:
+        return None
+    return subdomain
+
+class SiteHostMiddleware:
+    """
+    Serve hosted websites for requests addressed to <subdomain>.DOMAIN_NAME
+
+    The site is resolved from the Host header and the file from the request
+    path in one pass, before the router is consulted, so asset requests
+    never reach the redirect or API routes.
+    """
+
+    def __init__(self, app, domain_name):
+        self.app = app
+        self.domain_name = domain_name.lower()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        subdomain = site_subdomain(scope, self.domain_name)
+        if subdomain is None:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] not in ("GET", "HEAD"):
+            response = JSONResponse(
+                {"detail": "Method Not Allowed"},
+                status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
+                headers={"Allow": "GET, HEAD"}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            site_folder = await routing.sites.get(subdomain)
+            if not site_folder:
+                raise HTTPException(status_code=404, detail="Subdomain not found")
+            response = await serving.serve_site_file(Request(scope, receive), site_folder, scope["path"])
+        except HTTPException as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+
+        await response(scope, receive, send)
@@ -1,46 +1,171 @@
 import os
-import zipfile
+import stat
+import zlib
 import shutil
 import logging
-from pathlib import Path
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from . import blobs, deployments
+from .compression import PRECOMPRESS_MIN_SIZE, is_compressible
+from .routing import BASE_DIR
+
+# Entries that expand to more than this many times their compressed size are
+# refused as likely decompression bombs; entries below ZIP_RATIO_MIN_SIZE
+# uncompressed bytes are exempt, as tiny repetitive files compress extremely well
+ZIP_MAX_RATIO = float(os.getenv("ZIP_MAX_RATIO", "200"))
+ZIP_RATIO_MIN_SIZE = int(os.getenv("ZIP_RATIO_MIN_SIZE", str(1024 * 1024)))
 
-def extract_website(zip_file_path, subdomain):
+# Threads decompressing, hashing and precompressing the entries of one archive
+ZIP_EXTRACT_WORKERS = max(int(os.getenv("ZIP_EXTRACT_WORKERS", "4")), 1)
+
+def _servable_members(zip_ref):
     """
-    Extract a website ZIP file to the static_sites folder
+    Check a ZIP file's central directory against the deployment limits
+    
+    Only metadata is read: names, declared sizes and file modes. The sizes
+    are enforced again while extracting, in case the archive lies about them.
     
     Args:
-        zip_file_path: Path to the uploaded ZIP file
-        subdomain: The subdomain for the website
+        zip_ref: Open zipfile.ZipFile
         
     Returns:
-        dict: Success status and path information
+        dict: Relative posix path -> ZipInfo of every file to deploy
+        
+    Raises:
+        ValueError: The archive is unsafe or exceeds a limit
+    """
+    members = {}
+    total_size = 0
+    for info in zip_ref.infolist():
+        relative = deployments.normalize_path(info.filename)
+        if relative is None or info.is_dir():
+            continue
+        
+        if stat.S_ISLNK(info.external_attr >> 16):
+            raise ValueError(f"Security violation: Symbolic links are not allowed ({info.filename})")
+        
+        if info.file_size >= ZIP_RATIO_MIN_SIZE and info.file_size > ZIP_MAX_RATIO * max(info.compress_size, 1):
+            raise ValueError(f"{info.filename} expands more than {ZIP_MAX_RATIO:g} times; refusing a possible ZIP bomb")
+        
+        members[relative] = info
+        total_size += info.file_size
+    
+    members = deployments.drop_variants(members)
+    if len(members) > deployments.DEPLOYMENT_MAX_FILES:
+        raise ValueError(f"ZIP file has more than {deployments.DEPLOYMENT_MAX_FILES} files")
+    if total_size > deployments.DEPLOYMENT_MAX_SIZE:
+        raise ValueError(f"ZIP file expands to more than {deployments.DEPLOYMENT_MAX_SIZE // 1000000} MB")
+    
+    return members
+
+def check_zip(zip_file_path):
     """
-    # Define the destination directory
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    extract_path = os.path.join(base_dir, "static_sites", subdomain)
+    Validate a ZIP file's central directory without extracting anything
     
+    Args:
+        zip_file_path: Path to the uploaded ZIP file
+        
+    Returns:
+        tuple: (is_valid, error_message)
+    """
     try:
-        # Create the directory if it doesn't exist
-        os.makedirs(extract_path, exist_ok=True)
+        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+            _servable_members(zip_ref)
+    except zipfile.BadZipFile:
+        return False, "Invalid ZIP file"
+    except ValueError as e:
+        return False, str(e)
+    except Exception as e:
+        return False, f"Error reading ZIP file: {str(e)}"
+    
+    return True, ""
+
+def _store_batch(zip_file_path, batch):
+    """
+    Store a share of an archive's entries as blobs, with their precompressed variants
+    
+    Each batch reads through its own ZipFile handle, so batches decompress
+    in parallel instead of taking turns on one shared file position.
+    
+    Returns:
+        tuple: (files, stored_files, stored_bytes) where files maps relative
+        path -> sha256
+    """
+    files = {}
+    stored_files = 0
+    stored_bytes = 0
+    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+        for relative, info in batch:
+            with zip_ref.open(info) as source:
+                sha256, size, created = blobs.store(source, max_size=info.file_size)
+            
+            # Done here rather than in assemble() so compression runs in parallel too
+            if is_compressible(relative) and size >= PRECOMPRESS_MIN_SIZE:
+                blobs.ensure_variants(sha256)
+            
+            files[relative] = sha256
+            if created:
+                stored_files += 1
+                stored_bytes += size
+    return files, stored_files, stored_bytes
+
+def _store_members(zip_file_path, members):
+    """
+    Store all entries of an archive across ZIP_EXTRACT_WORKERS threads
+    
+    Returns:
+        tuple: (files, stored_files, stored_bytes) as for _store_batch
+    """
+    # Deal the largest entries out first so the batches finish together
+    batches = [[] for _ in range(max(min(ZIP_EXTRACT_WORKERS, len(members)), 1))]
+    ordered = sorted(members.items(), key=lambda item: item[1].file_size, reverse=True)
+    for position, member in enumerate(ordered):
+        batches[position % len(batches)].append(member)
+    
+    files = {}
+    stored_files = 0
+    stored_bytes = 0
+    with ThreadPoolExecutor(max_workers=len(batches), thread_name_prefix="unzip") as executor:
+        for batch_files, batch_stored, batch_bytes in executor.map(lambda batch: _store_batch(zip_file_path, batch), batches):
+            files.update(batch_files)
+            stored_files += batch_stored
+            stored_bytes += batch_bytes
+    return files, stored_files, stored_bytes
+
+def extract_deployment(zip_file_path, folder_path):
+    """
+    Build an immutable deployment folder from a website ZIP file
+    
+    The central directory is validated before anything is written. Entries
+    are then decompressed in parallel, each file is stored once in the
+    content-addressed blob store, and the deployment is hard-linked together
+    from the hashes collected on the way, so files unchanged since an earlier
+    deployment cost neither disk space nor recompression.
+    
+    Args:
+        zip_file_path: Path to the uploaded ZIP file
+        folder_path: Deployment folder relative to the backend package
         
-        # Clean any existing files
-        for item in os.listdir(extract_path):
-            item_path = os.path.join(extract_path, item)
-            if os.path.isdir(item_path):
-                shutil.rmtree(item_path)
-            else:
-                os.remove(item_path)
+    Returns:
+        dict: Success status, path information and file counts; success is
+        False only for archives that can never be deployed
         
-        # Extract the ZIP file
-        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-            # Check for malicious paths (directory traversal)
-            for file_name in zip_ref.namelist():
-                target_path = os.path.join(extract_path, file_name)
-                if not os.path.abspath(target_path).startswith(os.path.abspath(extract_path)):
-                    raise ValueError(f"Security violation: Attempted path traversal with {file_name}")
+    Raises:
+        OSError: Extraction failed for a reason a retry may not hit again
+    """
+    extract_path = os.path.join(BASE_DIR, folder_path)
+    
+    try:
+        files = {}
+        if not os.path.isdir(extract_path):
+            with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+                members = _servable_members(zip_ref)
             
-            # Extract all files
-            zip_ref.extractall(extract_path)
+            files, stored_files, stored_bytes = _store_members(zip_file_path, members)
+            logging.info(f"Stored {stored_files} new blobs ({stored_bytes} bytes) from {zip_file_path}")
+        
+        summary = deployments.assemble(folder_path, files)
         
         # Clean up the temporary ZIP file
         os.remove(zip_file_path)
@@ -49,48 +174,45 @@ def extract_website(zip_file_path, subdomain):
         return {
             "success": True,
             "extract_path": extract_path,
-            "relative_path": os.path.join("static_sites", subdomain)
+            "relative_path": folder_path,
+            **summary
         }
     
-    except zipfile.BadZipFile:
+    except (zipfile.BadZipFile, zlib.error, EOFError):
         logging.error(f"Invalid ZIP file: {zip_file_path}")
         return {
             "success": False,
             "error": "Invalid ZIP file"
         }
-    except ValueError as e:
+    except (ValueError, NotImplementedError, RuntimeError) as e:
+        # Limits exceeded, unsupported compression methods, encrypted entries
         logging.error(str(e))
         return {
             "success": False,
             "error": str(e)
         }
-    except Exception as e:
-        logging.error(f"Error extracting ZIP file: {str(e)}")
-        return {
-            "success": False,
-            "error": f"Error extracting ZIP file: {str(e)}"
-        }
+    # Anything else, such as a full disk or a blob garbage collected
+    # mid-build, is raised so the job is retried
 
-def delete_website_folder(subdomain):
+def delete_website_folder(folder_path):
     """
     Delete a website folder from static_sites
     
     Args:
-        subdomain: The subdomain of the website to delete
+        folder_path: The website folder relative to the backend package
         
     Returns:
         bool: Success status
     """
     try:
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        folder_path = os.path.join(base_dir, "static_sites", subdomain)
+        full_path = os.path.join(BASE_DIR, folder_path)
         
-        if os.path.exists(folder_path):
-            shutil.rmtree(folder_path)
-            logging.info(f"Deleted website folder: {folder_path}")
+        if os.path.exists(full_path):
+            shutil.rmtree(full_path)
+            logging.info(f"Deleted website folder: {full_path}")
             return True
         else:
-            logging.warning(f"Website folder not found: {folder_path}")
+            logging.warning(f"Website folder not found: {full_path}")
             return False
     except Exception as e:
         logging.error(f"Error deleting website folder: {str(e)}")
@@ -0,0 +1,102 @@
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads available for blocking filesystem and network work (ZIP extraction,
+# Cloudflare calls, folder moves) so it never runs on the event loop
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "4"))
+
+# Threads for bcrypt hashing and verification, kept apart from the blocking
+# pool so login bursts cannot delay extraction or file reads; bcrypt releases
+# the GIL, so threads run in parallel. Calls beyond PASSWORD_HASH_MAX_QUEUE
+# waiting ones are refused.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+class PoolBusy(Exception):
+    """Raised when a pool's wait queue is full"""
+
+class WorkerPool:
+    """
+    Bounded thread pool for blocking calls made from async handlers
+
+    At most max_workers calls run at once; further calls wait in the queue
+    without holding the event loop.
+    """
+
+    def __init__(self, name, max_workers, max_queue=None):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _call(self, func):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return func()
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run a blocking function in the pool and wait for its result
+
+        Args:
+            func: The blocking callable
+            *args, **kwargs: Arguments passed to func
+
+        Returns:
+            Whatever func returns; exceptions are re-raised in the caller
+
+        Raises:
+            PoolBusy: If max_queue calls are already waiting
+        """
+        with self._lock:
+            if self.max_queue is not None and self.queued >= self.max_queue:
+                self.rejected += 1
+                raise PoolBusy(f"{self.name} pool queue is full")
+            self.queued += 1
+        call = functools.partial(func, *args, **kwargs)
+        future = self._executor.submit(self._call, call)
+        # A caller cancelled while waiting also cancels the queued call, so
+        # _call never runs to take it off the queue count
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future):
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def stats(self):
+        """
+        Returns:
+            dict: Pool size and current queue depth
+        """
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
+
+blocking = WorkerPool("blocking", BLOCKING_WORKERS)
+
+password_hashing = WorkerPool("password-hashing", PASSWORD_HASH_WORKERS, max_queue=PASSWORD_HASH_MAX_QUEUE)
+
+def run_blocking(func, *args, **kwargs):
+    """Shortcut for blocking.run(); returns an awaitable"""
+    return blocking.run(func, *args, **kwargs)
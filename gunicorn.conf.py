@@ -0,0 +1,56 @@
+# Production server: gunicorn managing uvicorn workers
+#
+#   python -m backend.migrate
+#   gunicorn -c gunicorn.conf.py backend.main:app
+#
+# Every worker is a separate process with its own event loop, job workers,
+# database pool and caches; the in-memory routing tables of the others are
+# brought up to date within ROUTING_TABLE_TTL seconds.
+#
+# Restarts without dropping requests:
+#   kill -HUP <master pid>    new workers with re-read settings replace the old
+#                             ones, which finish their in-flight requests first.
+#                             With preload_app they run the code the master
+#                             loaded, so use USR2 for a new release:
+#   kill -USR2 <master pid>   start a new master with the new code next to the
+#                             old one, then kill -QUIT the old master once the
+#                             new workers are up
+import os
+import multiprocessing
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+
+# One worker per core: each is single-threaded for Python code, and blocking
+# work already runs in per-worker thread pools. WEB_CONCURRENCY overrides it.
+workers = int(os.getenv("WEB_CONCURRENCY") or multiprocessing.cpu_count())
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the application once in the master and fork the workers from it,
+# so they start quickly and share its memory pages. Nothing connects to the
+# database or starts threads at import time, so forking is safe.
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+# Pending connections the kernel queues while all workers are busy
+backlog = int(os.getenv("GUNICORN_BACKLOG", "2048"))
+
+# Seconds an idle keep-alive connection is held open; keep it above nginx's
+# upstream keepalive_timeout so nginx never reuses a connection being closed
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "75"))
+
+# Seconds a silent worker may block before it is killed, and seconds workers
+# get to finish in-flight requests on restart or shutdown
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "60"))
+
+# Replace each worker after this many requests (0 disables), staggered by the
+# jitter so they do not all restart at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+# Trust X-Forwarded-* from nginx
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "*")
+
+# Access log destination; set GUNICORN_ACCESS_LOG empty to turn it off
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
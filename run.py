@@ -1,7 +1,13 @@
 import uvicorn
 
+from backend.migrate import main as migrate
+
 if __name__ == "__main__":
-    # Run the FastAPI application using Uvicorn
+    # Create missing tables and columns before serving
+    migrate()
+
+    # Run the FastAPI application using Uvicorn with auto-reload, for development;
+    # production runs under gunicorn (see gunicorn.conf.py)
     # Host with 0.0.0.0 to allow connections from any IP
     # Use port 8000 by default
-    uvicorn.run("backend.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("backend.main:app", host="0.0.0.0", port=8000, reload=True)